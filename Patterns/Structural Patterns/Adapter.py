@@ -22,6 +22,13 @@
 # Create a component which aggregates (has a reference to, ...) the adaptee.
 # Intermediate representations can pile up: use caching and other optimizations.
 ################################################
+import contextlib
+import io
+import math
+import sys
+import time
+from array import array
+from collections import OrderedDict, defaultdict
 
 
 # ----------------------------------------------
@@ -60,6 +67,77 @@ class Rectangle(list):
     self.append(Line(Point(x, y+height), Point(x+width, y+height)))
 
 
+# ----------------------------------------------
+# Rasterization engine.
+# Integer Bresenham for any line (not only axis aligned ones), written as a
+# generator so a line can be streamed point by point with O(1) memory or
+# collected once into a cached buffer. Lines are half open: the end point is
+# not drawn, so connected lines do not draw their shared corner twice.
+# ----------------------------------------------
+def bresenham(x1:int, y1:int, x2:int, y2:int):
+  """
+  Lazily yield the (x, y) points from (x1, y1) towards (x2, y2).
+  """
+  dx = abs(x2 - x1)
+  dy = -abs(y2 - y1)
+  sx = 1 if x1 < x2 else -1
+  sy = 1 if y1 < y2 else -1
+  err = dx + dy
+  for _ in range(max(dx, -dy)):
+    yield x1, y1
+    e2 = 2 * err
+    if e2 >= dy:
+      err += dy
+      x1 += sx
+    if e2 <= dx:
+      err += dx
+      y1 += sy
+
+
+def antialiased(x1:int, y1:int, x2:int, y2:int):
+  """
+  Lazily yield (x, y, weight) for an anti-aliased line (Xiaolin Wu style):
+  each step covers the two pixels around the exact position, weighted by
+  distance. Weights of a step add up to 1.
+  """
+  dx = x2 - x1
+  dy = y2 - y1
+  n = max(abs(dx), abs(dy))
+  steep = abs(dy) > abs(dx)
+  for i in range(n):
+    if steep:
+      y = y1 + (i if dy > 0 else -i)
+      exact = x1 + dx * i / n
+      base = math.floor(exact)
+      frac = exact - base
+      yield base, y, 1 - frac
+      if frac:
+        yield base + 1, y, frac
+    else:
+      x = x1 + (i if dx > 0 else -i)
+      exact = y1 + dy * i / n
+      base = math.floor(exact)
+      frac = exact - base
+      yield x, base, 1 - frac
+      if frac:
+        yield x, base + 1, frac
+
+
+def line_points(line:Line):
+  """
+  Points of a line, always walked from the same endpoint (see line_key) so a
+  line and its reverse give the same points.
+  """
+  return bresenham(*line_key(line))
+
+
+def line_length(line:Line) -> int:
+  """
+  Number of points the line rasterizes to.
+  """
+  return max(abs(line.end.x - line.start.x), abs(line.end.y - line.start.y))
+
+
 # ----------------------------------------------
 # Creating an adapter without caching.
 # In order to adapt a line to a point you have to generate lots of points. Why
@@ -77,18 +155,9 @@ class LineToPointAdapter(list):
           f'[{line.start.x}, {line.start.y}] -> '
           f'[{line.end.x}, {line.end.y}]')
 
-    left = min(line.start.x, line.end.x)
-    right = max(line.start.x, line.end.x)
-    top = max(line.start.y, line.end.y)
-    bottom = min(line.start.y, line.end.y)
+    for x, y in line_points(line):
+      self.append(Point(x, y))
 
-    if right - left == 0:
-      for y in range (top, bottom):
-        self.append(Point(left, y))
-    elif top - bottom == 0:
-      for x in range(left, right):
-        self.append(Point(x, top))
-    
 
 def draw(rcs: list[Rectangle]):
   print('--- Drawing some stuff ---')
@@ -99,21 +168,410 @@ def draw(rcs: list[Rectangle]):
         draw_point(p)
 
 
+# ----------------------------------------------
+# Cache backends for the caching adapter.
+# A plain dict grows forever when the adapter is fed lots of distinct lines,
+# so the adapter talks to a small cache interface instead. Every backend
+# honours a max-entries and a max-bytes budget and keeps hit/miss/eviction
+# counters; subclasses only decide which entry goes first.
+# ----------------------------------------------
+class LineCache:
+  """
+  Unbounded cache (the original dict behavior) and base class for the
+  evicting backends.
+  """
+  def __init__(self, max_entries:int=None, max_bytes:int=None,
+               on_remove=None) -> None:
+    self.max_entries = max_entries
+    self.max_bytes = max_bytes
+    # Called with the value of every entry leaving the cache (evicted,
+    # expired, replaced or cleared), e.g. to give memory back to an arena.
+    self.on_remove = on_remove
+    # PointArena holding the spans stored here, owned by the cache (set by
+    # the caching adapter on first use).
+    self.arena = None
+    self.data = {}
+    self.sizes = {}
+    self.bytes = 0
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+
+  def __len__(self) -> int:
+    return len(self.data)
+
+  def __contains__(self, key) -> bool:
+    return key in self.data
+
+  def get(self, key):
+    if key in self.data:
+      self.hits += 1
+      self._touch(key)
+      return self.data[key]
+    self.misses += 1
+    return None
+
+  def put(self, key, value, size:int=0) -> None:
+    if key in self.data:
+      self._remove(key)
+    # Make room first, so the new entry is never its own victim.
+    while self._over_budget(size):
+      self._remove(self._victim())
+      self.evictions += 1
+    self.data[key] = value
+    self.sizes[key] = size
+    self.bytes += size
+    self._insert(key)
+
+  def clear(self) -> None:
+    for key in list(self.data):
+      self._remove(key)
+
+  def stats(self) -> dict:
+    lookups = self.hits + self.misses
+    return {
+      'policy': type(self).__name__,
+      'entries': len(self.data),
+      'bytes': self.bytes,
+      'hits': self.hits,
+      'misses': self.misses,
+      'evictions': self.evictions,
+      'hit_rate': self.hits / lookups if lookups else 0.0,
+    }
+
+  def _over_budget(self, size:int) -> bool:
+    """
+    Whether an entry of the given size does not fit yet. A single entry
+    bigger than max_bytes is still kept once the cache is empty.
+    """
+    if not self.data:
+      return False
+    if self.max_entries is not None and len(self.data) >= self.max_entries:
+      return True
+    return self.max_bytes is not None and self.bytes + size > self.max_bytes
+
+  def _remove(self, key) -> None:
+    value = self.data.pop(key)
+    self.bytes -= self.sizes.pop(key)
+    self._discard(key)
+    if self.on_remove is not None:
+      self.on_remove(value)
+
+  # Policy hooks
+  def _touch(self, key) -> None:
+    pass
+
+  def _insert(self, key) -> None:
+    pass
+
+  def _discard(self, key) -> None:
+    pass
+
+  def _victim(self):
+    return next(iter(self.data))
+
+
+class LRUCache(LineCache):
+  """
+  Evicts the least recently used entry.
+  """
+  def __init__(self, max_entries:int=None, max_bytes:int=None,
+               on_remove=None) -> None:
+    super().__init__(max_entries, max_bytes, on_remove)
+    self.order = OrderedDict()
+
+  def _touch(self, key) -> None:
+    self.order.move_to_end(key)
+
+  def _insert(self, key) -> None:
+    self.order[key] = None
+
+  def _discard(self, key) -> None:
+    del self.order[key]
+
+  def _victim(self):
+    return next(iter(self.order))
+
+
+class LFUCache(LineCache):
+  """
+  Evicts the least frequently used entry (the oldest one on ties).
+  Keys are bucketed by use count, so get and put are O(1). Only when the
+  lowest bucket empties by a removal is the new minimum looked up, once,
+  at the next eviction (O(distinct counts)).
+  """
+  def __init__(self, max_entries:int=None, max_bytes:int=None,
+               on_remove=None) -> None:
+    super().__init__(max_entries, max_bytes, on_remove)
+    self.freq = {}
+    self.buckets = defaultdict(OrderedDict)
+    self.min_freq = 0
+
+  def _touch(self, key) -> None:
+    f = self.freq[key]
+    bucket = self.buckets[f]
+    del bucket[key]
+    if not bucket:
+      del self.buckets[f]
+      if self.min_freq == f:
+        self.min_freq = f + 1
+    self.freq[key] = f + 1
+    self.buckets[f + 1][key] = None
+
+  def _insert(self, key) -> None:
+    self.freq[key] = 1
+    self.buckets[1][key] = None
+    self.min_freq = 1
+
+  def _discard(self, key) -> None:
+    f = self.freq.pop(key)
+    bucket = self.buckets[f]
+    del bucket[key]
+    if not bucket:
+      del self.buckets[f]
+
+  def _victim(self):
+    if self.min_freq not in self.buckets:
+      self.min_freq = min(self.buckets)
+    return next(iter(self.buckets[self.min_freq]))
+
+
+class TTLCache(LineCache):
+  """
+  Entries expire `ttl` seconds after being stored. When over budget the
+  entry closest to expiring is evicted first.
+  """
+  def __init__(self, ttl:float, max_entries:int=None, max_bytes:int=None,
+               on_remove=None, clock=time.monotonic) -> None:
+    super().__init__(max_entries, max_bytes, on_remove)
+    self.ttl = ttl
+    self.clock = clock
+    self.expires = OrderedDict()
+    self.expirations = 0
+
+  def get(self, key):
+    if key in self.expires and self.expires[key] <= self.clock():
+      self._remove(key)
+      self.expirations += 1
+    return super().get(key)
+
+  def put(self, key, value, size:int=0) -> None:
+    # Entries are kept in expiry order (same ttl for all), so the expired
+    # ones are at the front.
+    now = self.clock()
+    while self.expires:
+      oldest, expires = next(iter(self.expires.items()))
+      if expires > now:
+        break
+      self._remove(oldest)
+      self.expirations += 1
+    super().put(key, value, size)
+
+  def stats(self) -> dict:
+    stats = super().stats()
+    stats['expirations'] = self.expirations
+    return stats
+
+  def _insert(self, key) -> None:
+    self.expires[key] = self.clock() + self.ttl
+
+  def _discard(self, key) -> None:
+    del self.expires[key]
+
+  def _victim(self):
+    return next(iter(self.expires))
+
+
+# ----------------------------------------------
+# Value based keys and a compact point store.
+# hash(line) is identity based, so two equal lines built separately never
+# shared a cache entry. line_key() uses the coordinates instead (endpoints
+# in a fixed order, so a line and its reverse share the same points).
+# Cached points live as x, y int pairs in one shared array('i') (8 bytes per
+# point instead of a full Point object); PointSpan and PointView are thin
+# views over it.
+# ----------------------------------------------
+def line_key(line:Line) -> tuple:
+  """
+  Hashable, value based key for a line.
+  """
+  return line_key_coords(line.start.x, line.start.y, line.end.x, line.end.y)
+
+
+def line_key_coords(x1:int, y1:int, x2:int, y2:int) -> tuple:
+  a = (x1, y1)
+  b = (x2, y2)
+  return a + b if a <= b else b + a
+
+
+class PointView:
+  """
+  Read-only point backed by a PointSpan. Quacks like a Point.
+  """
+  __slots__ = ('span', 'i')
+
+  def __init__(self, span:'PointSpan', i:int) -> None:
+    self.span = span
+    self.i = i
+
+  @property
+  def x(self) -> int:
+    return self.span.data[self.span.start + 2 * self.i]
+
+  @property
+  def y(self) -> int:
+    return self.span.data[self.span.start + 2 * self.i + 1]
+
+  def __repr__(self) -> str:
+    return f'Point({self.x}, {self.y})'
+
+
+class PointSpan:
+  """
+  A run of points stored in a PointArena.
+  """
+  __slots__ = ('data', 'start', 'length')
+
+  def __init__(self, data:array, start:int, length:int) -> None:
+    self.data = data
+    self.start = start
+    self.length = length
+
+  def __len__(self) -> int:
+    return self.length
+
+  def __getitem__(self, i:int) -> PointView:
+    if i < 0:
+      i += self.length
+    if not 0 <= i < self.length:
+      raise IndexError('point index out of range')
+    return PointView(self, i)
+
+  def __iter__(self):
+    for i in range(self.length):
+      yield PointView(self, i)
+
+  def coords(self) -> array:
+    return self.data[self.start:self.start + 2 * self.length]
+
+  def nbytes(self) -> int:
+    return sys.getsizeof(self) + 2 * self.length * self.data.itemsize
+
+  def detach(self) -> None:
+    """
+    Give the span its own copy so it outlives being freed from the arena.
+    """
+    self.data = self.coords()
+    self.start = 0
+
+
+class PointStream:
+  """
+  Lazy, re-iterable points of a line. Nothing is stored between passes.
+  """
+  __slots__ = ('x1', 'y1', 'x2', 'y2')
+
+  def __init__(self, x1:int, y1:int, x2:int, y2:int) -> None:
+    self.x1, self.y1, self.x2, self.y2 = x1, y1, x2, y2
+
+  def __len__(self) -> int:
+    return max(abs(self.x2 - self.x1), abs(self.y2 - self.y1))
+
+  def __iter__(self):
+    for x, y in bresenham(self.x1, self.y1, self.x2, self.y2):
+      yield Point(x, y)
+
+
+class PointArena:
+  """
+  One growable array('i') of x, y pairs shared by every cached line.
+  Freed spans are detached (they keep working for whoever still holds them)
+  and the arena compacts itself once more than half of it is garbage.
+  """
+  def __init__(self) -> None:
+    self.data = array('i')
+    self.spans = set()
+    self.garbage = 0
+
+  def alloc(self, coords) -> PointSpan:
+    start = len(self.data)
+    self.data.extend(coords)
+    span = PointSpan(self.data, start, (len(self.data) - start) // 2)
+    self.spans.add(span)
+    return span
+
+  def free(self, span:PointSpan) -> None:
+    if span not in self.spans:
+      return
+    self.spans.remove(span)
+    span.detach()
+    self.garbage += 2 * len(span)
+    if self.garbage * 2 > len(self.data):
+      self.compact()
+
+  def compact(self) -> None:
+    data = array('i')
+    for span in sorted(self.spans, key=lambda s: s.start):
+      start = len(data)
+      data.extend(span.coords())
+      span.data = data
+      span.start = start
+    self.data = data
+    self.garbage = 0
+
+  def nbytes(self) -> int:
+    return len(self.data) * self.data.itemsize
+
+
 # ----------------------------------------------
 # Creating an adapter with caching
 # Optimize the problem raised in the no caching adapter.
+# The cache backend is pluggable: pass any LineCache to the adapter (or
+# replace the class-level default) to choose the eviction policy and budget.
+# Every cache gets its own point arena the first time the adapter stores
+# spans in it, hooked so evicted spans are freed without any wiring by the
+# caller; the arena goes away with the cache.
+# Lines longer than max_cached_length are not cached at all: they are
+# streamed with a PointStream so a few huge lines cannot flush the cache.
 # ----------------------------------------------
+def arena_of(cache:LineCache) -> PointArena:
+  """
+  The arena of the cache, created and hooked to the cache's removals
+  (keeping any on_remove it already had) on first use.
+  """
+  if cache.arena is not None:
+    return cache.arena
+  arena = cache.arena = PointArena()
+  hook = cache.on_remove
+  if hook is None:
+    cache.on_remove = arena.free
+  else:
+    def on_remove(value) -> None:
+      hook(value)
+      arena.free(value)
+    cache.on_remove = on_remove
+  return arena
+
+
 class LineToPointAdapterCashing():
   """
   This adapter will help us to represent the lines as a serie of points.
   Use caching.
   """
   count = 0
-  cache = {}
+  cache = LRUCache(max_entries=10_000)
+  max_cached_length = 4096
 
-  def __init__(self, line:Line) -> None:
-    self.h = hash(line)
-    if self.h in LineToPointAdapterCashing.cache:
+  def __init__(self, line:Line, cache:LineCache=None) -> None:
+    cache = LineToPointAdapterCashing.cache if cache is None else cache
+    self.h = line_key(line)
+    if line_length(line) > LineToPointAdapterCashing.max_cached_length:
+      self.points = PointStream(*self.h)
+      return
+
+    # Keep our own reference: the entry may be evicted before we are iterated.
+    self.points = cache.get(self.h)
+    if self.points is not None:
       return
 
     LineToPointAdapterCashing.count += 1
@@ -121,35 +579,128 @@ class LineToPointAdapterCashing():
           f'[{line.start.x}, {line.start.y}] -> '
           f'[{line.end.x}, {line.end.y}]')
 
-    left = min(line.start.x, line.end.x)
-    right = max(line.start.x, line.end.x)
-    top = max(line.start.y, line.end.y)
-    bottom = min(line.start.y, line.end.y)
-
-    points = []
+    coords = []
+    for point in line_points(line):
+      coords += point
 
-    if right - left == 0:
-      for y in range (top, bottom):
-        points.append(Point(left, y))
-    elif top - bottom == 0:
-      for x in range(left, right):
-        points.append(Point(x, top))
-
-    LineToPointAdapterCashing.cache[self.h] = points
+    self.points = arena_of(cache).alloc(coords)
+    cache.put(self.h, self.points, self.points.nbytes())
 
   def __iter__(self):
-    return iter(LineToPointAdapterCashing.cache[self.h])
+    return iter(self.points)
 
 
-def draw_caching(rcs: list[Rectangle]):
+def draw_caching(rcs: list[Rectangle], cache:LineCache=None):
   print('--- Drawing some stuff ---')
   for rc in rcs:
     for line in rc:
-      adapter = LineToPointAdapterCashing(line)
+      adapter = LineToPointAdapterCashing(line, cache)
       for p in adapter:
         draw_point(p)
 
 
+# ----------------------------------------------
+# Batch rasterization.
+# Instead of one adapter and one draw_point call per pixel, take all the
+# lines (or rectangles) as flat int arrays and write every point into a
+# single x, y coordinate buffer. Each line is filled with array slice
+# assignments, which run in C, and the consumer gets the whole buffer in one
+# call.
+# ----------------------------------------------
+def draw_points(buffer:array) -> None:
+  """
+  Batch counterpart of draw_point: receives a flat x, y buffer.
+  """
+  print('.' * (len(buffer) // 2), end='')
+
+
+def lines_to_array(lines) -> array:
+  """
+  Flatten Line objects into x1, y1, x2, y2, ... ints.
+  """
+  coords = array('i')
+  for line in lines:
+    coords.extend((line.start.x, line.start.y, line.end.x, line.end.y))
+  return coords
+
+
+def rectangles_to_lines(rects) -> array:
+  """
+  Expand x, y, width, height, ... into the four edges of each rectangle,
+  in the same order Rectangle uses.
+  """
+  lines = array('i')
+  for i in range(0, len(rects), 4):
+    x, y, w, h = rects[i:i + 4]
+    lines.extend((x, y, x + w, y,
+                  x + w, y, x + w, y + h,
+                  x, y, x, y + h,
+                  x, y + h, x + w, y + h))
+  return lines
+
+
+def rasterize_lines(lines) -> array:
+  """
+  Points of every line in x1, y1, x2, y2, ... as one flat x, y buffer.
+  Same points, in the same order, as the per-line adapters. Axis aligned
+  lines take the slice assignment fast path, the rest go through Bresenham.
+  """
+  buffer = array('i')
+  for i in range(0, len(lines), 4):
+    x1, y1, x2, y2 = lines[i:i + 4]
+    if x1 == x2:
+      lo, hi, fixed, axis = min(y1, y2), max(y1, y2), x1, 1
+    elif y1 == y2:
+      lo, hi, fixed, axis = min(x1, x2), max(x1, x2), y1, 0
+    else:
+      for point in bresenham(*line_key_coords(x1, y1, x2, y2)):
+        buffer.extend(point)
+      continue
+    n = hi - lo
+    if n <= 0:
+      continue
+    start = len(buffer)
+    buffer.extend(array('i', [fixed]) * (2 * n))
+    buffer[start + axis:start + 2 * n:2] = array('i', range(lo, hi))
+  return buffer
+
+
+def rasterize_rectangles(rects) -> array:
+  return rasterize_lines(rectangles_to_lines(rects))
+
+
+def draw_batch(rcs: list[Rectangle]):
+  print('--- Drawing some stuff ---')
+  draw_points(rasterize_lines(lines_to_array(line for rc in rcs for line in rc)))
+
+
+def benchmark_batch(n:int=2000, size:int=100, repeat:int=3) -> None:
+  """
+  Compare the per-point adapter path with the batch path. Output is
+  discarded so only the rasterization and draw calls are measured.
+  """
+  rcs = [Rectangle(i, i, size, size) for i in range(n)]
+  flat = array('i')
+  for i in range(n):
+    flat.extend((i, i, size, size))
+
+  def best(fn) -> float:
+    times = []
+    for _ in range(repeat):
+      with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+  per_point = best(lambda: draw(rcs))
+  batch = best(lambda: draw_points(rasterize_rectangles(flat)))
+  points = len(rasterize_rectangles(flat)) // 2
+  print(f'{n} rectangles, {points} points')
+  print(f'Per-point adapter: {per_point * 1000:.1f}ms')
+  print(f'Batch buffer:      {batch * 1000:.1f}ms ({per_point / batch:.1f}x faster)')
+
+
 if __name__ == '__main__':
   rcs = [
     Rectangle(1, 1, 10, 10),
@@ -162,3 +713,43 @@ if __name__ == '__main__':
   print('................................................')
   print('Adapter (with caching)')
   draw_caching(rcs)
+
+  print()
+  print(LineToPointAdapterCashing.cache.stats())
+
+  print('................................................')
+  print('Adapter (with caching, bounded backends)')
+  for cache in [LRUCache(max_entries=8), LFUCache(max_entries=8),
+                TTLCache(ttl=60, max_bytes=1024)]:
+    draw_caching(rcs, cache)
+    draw_caching(rcs, cache)
+    print()
+    print(cache.stats())
+
+  print('................................................')
+  print('Adapter (with caching, equal lines share one entry)')
+  cache = LRUCache()
+  draw_caching([Rectangle(1, 1, 10, 10)], cache)
+  draw_caching([Rectangle(1, 1, 10, 10)], cache)
+  print()
+  print(cache.stats())
+  print(f'Point arena: {cache.arena.nbytes()} bytes')
+
+  print('................................................')
+  print('Adapter (batch rasterization)')
+  draw_batch(rcs)
+  print()
+  benchmark_batch()
+
+  print('................................................')
+  print('Adapter (diagonal lines)')
+  diagonal = Line(Point(0, 0), Point(6, 3))
+  print([(p.x, p.y) for p in LineToPointAdapter(diagonal)])
+  print([(x, y, round(w, 2)) for x, y, w in antialiased(0, 0, 6, 3)])
+
+  print('................................................')
+  print('Adapter (long lines are streamed, not cached)')
+  long_line = Line(Point(0, 0), Point(100_000, 1))
+  adapter = LineToPointAdapterCashing(long_line)
+  print(f'{type(adapter.points).__name__}: {len(adapter.points)} points, '
+        f'cached: {adapter.h in LineToPointAdapterCashing.cache}')
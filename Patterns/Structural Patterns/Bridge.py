@@ -39,48 +39,222 @@
 # Objects: circle, square
 # Draws implementation: vector, raster
 # Combination result: circleVector, circleRaster, squareVector, squareRaster
+import math, random, time
 from abc import ABC
 
 
 class Renderer(ABC):
-  def render_circle(self, radius): pass
-  def render_square(self, side): pass
+  def render_circle(self, radius, x=0, y=0): pass
+  def render_square(self, side, x=0, y=0): pass
+
+  # Bulk interface: one call per batch of shapes of the same kind. The
+  # default just loops; renderers override it when they can do better.
+  def render_circles(self, circles):
+    for radius, x, y in circles:
+      self.render_circle(radius, x, y)
+
+  def render_squares(self, squares):
+    for side, x, y in squares:
+      self.render_square(side, x, y)
   
 
 class VectorRenderer(Renderer):
-  def render_circle(self, radius):
+  def render_circle(self, radius, x=0, y=0):
     print(f'Drawing a circle of radius {radius}')
   
-  def render_square(self, side):
+  def render_square(self, side, x=0, y=0):
     print(f'Drawing a square of side {side}')
 
 
 class RasterRenderer(Renderer):
-  def render_circle(self, radius):
+  def render_circle(self, radius, x=0, y=0):
     print(f'Drawing pixels for a circle of radius {radius}')
 
-  def render_square(self, side):
+  def render_square(self, side, x=0, y=0):
     print(f'Drawing pixels for a square of side {side}')
 
 
+class PixelBufferRenderer(RasterRenderer):
+  """
+  Raster renderer that really fills pixels: an 8-bit width x height
+  bytearray, one row after the other. Every shape is drawn as horizontal
+  spans written with slice assignment.
+  """
+  def __init__(self, width, height, ink=255):
+    self.width = width
+    self.height = height
+    self.ink = ink
+    self.pixels = bytearray(width * height)
+
+  def _span(self, y, x0, x1):
+    if not 0 <= y < self.height:
+      return
+    x0 = max(x0, 0)
+    x1 = min(x1, self.width - 1)
+    if x0 <= x1:
+      row = y * self.width
+      self.pixels[row + x0:row + x1 + 1] = bytes((self.ink,)) * (x1 - x0 + 1)
+
+  def render_circle(self, radius, x=0, y=0):
+    r, x, y = int(radius), int(x), int(y)
+    for dy in range(max(-r, -y), min(r, self.height - 1 - y) + 1):
+      dx = math.isqrt(r * r - dy * dy)
+      self._span(y + dy, x - dx, x + dx)
+
+  def render_square(self, side, x=0, y=0):
+    side, x, y = int(side), int(x), int(y)
+    for row in range(max(y, 0), min(y + side, self.height)):
+      self._span(row, x, x + side - 1)
+
+  def clear(self):
+    self.pixels[:] = bytes(len(self.pixels))
+
+  def coverage(self):
+    return (len(self.pixels) - self.pixels.count(0)) / len(self.pixels)
+
+
 class Shape:
-  def __init__(self, renderer):
+  kind = None
+
+  def __init__(self, renderer, x=0, y=0):
     self.renderer = renderer
+    self.x = x
+    self.y = y
     
   def draw(self): pass
   def resize(self, factor): pass
+  def params(self): pass
+  def bounds(self): pass
 
 
 class Circle(Shape):
-  def __init__(self, renderer, radius):
-    super().__init__(renderer)
+  kind = 'circle'
+
+  def __init__(self, renderer, radius, x=0, y=0):
+    super().__init__(renderer, x, y)
     self.radius = radius
 
   def draw(self):
-    self.renderer.render_circle(self.radius)
+    self.renderer.render_circle(self.radius, self.x, self.y)
     
   def resize(self, factor):
     self.radius *= factor
+
+  def params(self):
+    return self.radius, self.x, self.y
+
+  def bounds(self):
+    return (self.x - self.radius, self.y - self.radius,
+            self.x + self.radius, self.y + self.radius)
+
+
+class Square(Shape):
+  kind = 'square'
+
+  def __init__(self, renderer, side, x=0, y=0):
+    super().__init__(renderer, x, y)
+    self.side = side
+
+  def draw(self):
+    self.renderer.render_square(self.side, self.x, self.y)
+
+  def resize(self, factor):
+    self.side *= factor
+
+  def params(self):
+    return self.side, self.x, self.y
+
+  def bounds(self):
+    return self.x, self.y, self.x + self.side, self.y + self.side
+
+
+# ----------------------------------------------
+# Batching and culling for large scenes.
+# RenderQueue collects shapes and flushes them grouped by renderer and
+# kind, with one bulk call per group. SpatialGrid buckets shapes into
+# uniform cells by bounding box, so a viewport only looks at the shapes in
+# the cells it overlaps.
+# ----------------------------------------------
+class RenderQueue:
+  def __init__(self):
+    self.shapes = []
+
+  def submit(self, shape):
+    self.shapes.append(shape)
+
+  def flush(self):
+    batches = {}
+    for shape in self.shapes:
+      key = (id(shape.renderer), shape.kind)
+      if key not in batches:
+        batches[key] = (shape.renderer, shape.kind, [])
+      batches[key][2].append(shape.params())
+    self.shapes = []
+    for renderer, kind, params in batches.values():
+      getattr(renderer, f'render_{kind}s')(params)
+    return len(batches)
+
+
+class SpatialGrid:
+  def __init__(self, cell_size):
+    self.cell_size = cell_size
+    self.cells = {}
+    self.where = {}
+
+  def _cells(self, bounds):
+    x0, y0, x1, y1 = (int(v // self.cell_size) for v in bounds)
+    return [(cx, cy) for cx in range(x0, x1 + 1) for cy in range(y0, y1 + 1)]
+
+  def add(self, shape):
+    cells = self._cells(shape.bounds())
+    self.where[id(shape)] = cells
+    for cell in cells:
+      self.cells.setdefault(cell, []).append(shape)
+
+  def remove(self, shape):
+    for cell in self.where.pop(id(shape)):
+      bucket = self.cells[cell]
+      bucket.remove(shape)
+      if not bucket:
+        del self.cells[cell]
+
+  def update(self, shape):
+    """
+    Call after moving or resizing a shape.
+    """
+    self.remove(shape)
+    self.add(shape)
+
+  def query(self, viewport):
+    """
+    Shapes whose bounding box intersects viewport (x0, y0, x1, y1).
+    """
+    vx0, vy0, vx1, vy1 = viewport
+    found = {}
+    for cell in self._cells(viewport):
+      for shape in self.cells.get(cell, ()):
+        if id(shape) in found:
+          continue
+        x0, y0, x1, y1 = shape.bounds()
+        if x0 <= vx1 and vx0 <= x1 and y0 <= vy1 and vy0 <= y1:
+          found[id(shape)] = shape
+    return list(found.values())
+
+
+class Scene:
+  def __init__(self, cell_size=64):
+    self.index = SpatialGrid(cell_size)
+    self.queue = RenderQueue()
+
+  def add(self, shape):
+    self.index.add(shape)
+
+  def draw(self, viewport):
+    visible = self.index.query(viewport)
+    for shape in visible:
+      self.queue.submit(shape)
+    self.queue.flush()
+    return len(visible)
   
   
 if __name__ == '__main__':
@@ -98,4 +272,24 @@ if __name__ == '__main__':
   circle2.draw()
   circle2.resize(2)
   circle2.draw()
-  
\ No newline at end of file
+  
+  print('................................................')
+  print('Batched rendering')
+  queue = RenderQueue()
+  for shape in [Circle(vector, 1), Square(raster, 2), Circle(vector, 3), Square(raster, 4)]:
+    queue.submit(shape)
+  print(f'{queue.flush()} bulk calls')
+  
+  print('................................................')
+  print('Large scene, culled by a spatial grid into a pixel buffer')
+  pixels = PixelBufferRenderer(512, 512)
+  scene = Scene(cell_size=64)
+  for _ in range(100_000):
+    shape = random.choice([Circle, Square])
+    scene.add(shape(pixels, random.randint(1, 8),
+                    random.randint(0, 8191), random.randint(0, 8191)))
+  start = time.perf_counter()
+  drawn = scene.draw((0, 0, 511, 511))
+  print(f'{drawn} of 100000 shapes in the viewport, drawn in '
+        f'{(time.perf_counter() - start) * 1000:.1f}ms '
+        f'({pixels.coverage():.1%} of the pixels set)')
@@ -46,6 +46,7 @@
 
 from unittest import TestCase, main
 from abc import ABC
+import sys, time, tracemalloc
 
 
 class Renderer(ABC):
@@ -68,15 +69,56 @@ class VectorRenderer(Renderer):
         
 
 class Shape:
+    # One interned description per (shape class, renderer class): the
+    # renderers' what_to_render_as is fixed per class, so it is built once.
+    descriptions = {}
+
     def __init__(self, render):
         self.render = render
         # self.name = None
         
     def __str__(self):
-        return 'Drawing ' + type(self).__name__ + self.render.what_to_render_as
+        key = (type(self), type(self.render))
+        description = Shape.descriptions.get(key)
+        if description is None:
+            description = sys.intern(
+                'Drawing ' + type(self).__name__ + self.render.what_to_render_as)
+            Shape.descriptions[key] = description
+        return description
         # return 'Drawing ' + self.name + self.render.what_to_render_as
 
 
+def describe_all(shapes, sep='\n'):
+    """
+    Describe a batch of shapes with one join over the cached descriptions.
+    """
+    return sep.join(map(str, shapes))
+
+
+def describe_uncached(shape):
+    return 'Drawing ' + type(shape).__name__ + shape.render.what_to_render_as
+
+
+def benchmark_describe(n=100_000):
+    """
+    Time and allocated memory for describing n shapes, building a fresh
+    string per shape versus reusing the cached descriptions.
+    """
+    shapes = [Square(VectorRenderer()) if i % 2 else Triangle(RasterRenderer())
+              for i in range(n)]
+    for name, describe in [('fresh strings', lambda: list(map(describe_uncached, shapes))),
+                           ('cached', lambda: list(map(str, shapes)))]:
+        tracemalloc.start()
+        start = time.perf_counter()
+        descriptions = describe()
+        elapsed = time.perf_counter() - start
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        print(f'{name:>13}: {n} descriptions in {elapsed * 1000:.1f}ms, '
+              f'{memory / 1024:,.0f} KiB held')
+        del descriptions
+
+
 class Triangle(Shape):
      def __init__(self, render):
          super().__init__(render)
@@ -100,7 +142,21 @@ class Evaluate(TestCase):
         tr = Triangle(RasterRenderer())
         self.assertEqual(str(tr), 'Drawing Triangle as pixels')
 
+    def test_descriptions_are_shared(self):
+        first = Square(RasterRenderer())
+        second = Square(RasterRenderer())
+        self.assertIs(str(first), str(second))
+        self.assertEqual(str(Square(VectorRenderer())), 'Drawing Square as lines')
+
+    def test_describe_all(self):
+        shapes = [Square(VectorRenderer()), Triangle(RasterRenderer())]
+        self.assertEqual(describe_all(shapes),
+                         'Drawing Square as lines\nDrawing Triangle as pixels')
 
 
 if __name__ == '__main__':
-    main() 
\ No newline at end of file
+    # python CodingExerciseBridge.py --benchmark times the description cache.
+    if '--benchmark' in sys.argv:
+        benchmark_describe()
+    else:
+        main() 
\ No newline at end of file
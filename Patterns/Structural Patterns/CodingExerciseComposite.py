@@ -25,31 +25,159 @@
 ################################################
 from unittest import TestCase, main
 from abc import ABC
+from collections import namedtuple
 from collections.abc import Iterable
 
 
+# Aggregates are cached per node. A mutation marks the node and its
+# ancestors dirty (stopping at the first one already dirty), so repeated
+# reads are O(1) and updating a leaf costs O(depth).
+Aggregate = namedtuple('Aggregate', 'sum count min max')
+EMPTY = Aggregate(0, 0, None, None)
+
+
+def combine(a: Aggregate, b: Aggregate) -> Aggregate:
+  if not b.count:
+    return a
+  if not a.count:
+    return b
+  return Aggregate(a.sum + b.sum, a.count + b.count,
+                   min(a.min, b.min), max(a.max, b.max))
+
+
 class Summable(Iterable, ABC):   
+  def __init__(self):
+    self._aggregate = None
+    self._parents = []
+
   @property
   def sum(self):
-    #return sum([item for item_list in self for item in item_list])
-    result = 0
-    for item_list in self:
-      for item in item_list:
-        result += item
-        
-    return result
+    return self.aggregate.sum
+
+  @property
+  def count(self):
+    return self.aggregate.count
+
+  @property
+  def min(self):
+    return self.aggregate.min
+
+  @property
+  def max(self):
+    return self.aggregate.max
+
+  @property
+  def aggregate(self) -> Aggregate:
+    if self._aggregate is None:
+      result = EMPTY
+      for item in self:
+        if isinstance(item, Summable):
+          result = combine(result, item.aggregate)
+        else:
+          result = combine(result, Aggregate(item, 1, item, item))
+      self._aggregate = result
+    return self._aggregate
+
+  def _invalidate(self):
+    stack = [self]
+    while stack:
+      node = stack.pop()
+      if node._aggregate is None and node is not self:
+        continue
+      node._aggregate = None
+      stack.extend(node._parents)
+
+  def _adopt(self, items):
+    for item in items:
+      if isinstance(item, Summable):
+        item._parents.append(self)
+
+  def _orphan(self, items):
+    for item in items:
+      if isinstance(item, Summable):
+        # By identity: ManyValues compares equal by contents.
+        for k, parent in enumerate(item._parents):
+          if parent is self:
+            del item._parents[k]
+            break
 
 
 class SingleValue(Summable):
   def __init__(self, value):
-      self.value = value
+      super().__init__()
+      self._value = value
+
+  @property
+  def value(self):
+      return self._value
+
+  @value.setter
+  def value(self, value):
+      self._value = value
+      self._invalidate()
         
   def __iter__(self):
       yield self.value
 
 
 class ManyValues(list, Summable):
-  pass
+  def __init__(self, values=()):
+    list.__init__(self)
+    Summable.__init__(self)
+    self.extend(values)
+
+  def _changed(self, removed, added):
+    self._orphan(removed)
+    self._adopt(added)
+    self._invalidate()
+
+  def append(self, item):
+    super().append(item)
+    self._changed((), (item,))
+
+  def extend(self, items):
+    items = list(items)
+    super().extend(items)
+    self._changed((), items)
+
+  def __iadd__(self, items):
+    self.extend(items)
+    return self
+
+  def __imul__(self, n):
+    items = list(self)
+    super().__imul__(n)
+    self._changed(items, list(self))
+    return self
+
+  def insert(self, index, item):
+    super().insert(index, item)
+    self._changed((), (item,))
+
+  def __setitem__(self, key, value):
+    removed = self[key] if isinstance(key, slice) else [self[key]]
+    value = list(value) if isinstance(key, slice) else value
+    super().__setitem__(key, value)
+    self._changed(removed, value if isinstance(key, slice) else [value])
+
+  def __delitem__(self, key):
+    removed = self[key] if isinstance(key, slice) else [self[key]]
+    super().__delitem__(key)
+    self._changed(removed, ())
+
+  def pop(self, index=-1):
+    item = super().pop(index)
+    self._changed((item,), ())
+    return item
+
+  def remove(self, item):
+    index = self.index(item)
+    del self[index]
+
+  def clear(self):
+    items = list(self)
+    super().clear()
+    self._changed(items, ())
 
   
 class TestFirstSuite(TestCase):
@@ -64,6 +192,34 @@ class TestFirstSuite(TestCase):
     all_values.append(single_value)
     all_values.append(other_values)
     self.assertEqual(all_values.sum, 66)
+
+  def test_aggregates(self):
+    values = ManyValues([SingleValue(5), ManyValues([1, 9]), 3])
+    self.assertEqual(values.aggregate, Aggregate(18, 4, 1, 9))
+    self.assertEqual(ManyValues().aggregate, EMPTY)
+
+  def test_cached_until_mutated(self):
+    inner = ManyValues([1, 2])
+    outer = ManyValues([inner, 10])
+    self.assertEqual(outer.sum, 13)
+    self.assertIsNotNone(outer._aggregate)
+    inner.append(4)
+    self.assertIsNone(outer._aggregate)
+    self.assertEqual(outer.sum, 17)
+    inner[0] = 100
+    self.assertEqual(outer.sum, 116)
+    del outer[0]
+    self.assertEqual(outer.sum, 10)
+    inner.append(1)
+    self.assertIsNotNone(outer._aggregate)
+
+  def test_leaf_update_propagates(self):
+    leaf = SingleValue(1)
+    middle = ManyValues([leaf])
+    top = ManyValues([middle, ManyValues([leaf])])
+    self.assertEqual((top.sum, top.max), (2, 1))
+    leaf.value = 7
+    self.assertEqual((top.sum, top.max, middle.sum), (14, 7, 7))
       
       
 if __name__ == '__main__':
@@ -11,6 +11,7 @@
 #     sentence[1].capitalize = True
 #     print(sentence)  # writes "hello WORLD"
 ################################################
+from array import array
 from unittest import TestCase, main
 
 
@@ -45,11 +46,121 @@ class Sentence:
     return ' '.join(result)
 
 
+# Variant for large texts: words are offsets into the original string
+# instead of split() copies, indexing only creates a small handle (reading
+# stores nothing), every formatted word points to one shared immutable
+# WordFormat per combination and the output is streamed in chunks.
+class WordFormat:
+  cache = {}
+
+  def __new__(cls, capitalize: bool=False) -> 'WordFormat':
+    key = (capitalize,)
+    if key not in cls.cache:
+      token = super().__new__(cls)
+      object.__setattr__(token, 'capitalize', capitalize)
+      cls.cache[key] = token
+    return cls.cache[key]
+
+  def __setattr__(self, name, value):
+    raise AttributeError('WordFormat is immutable')
+
+  def apply(self, word: str) -> str:
+    return word.upper() if self.capitalize else word
+
+
+class SparseSentence:
+  PLAIN = WordFormat()
+
+  def __init__(self, plain_text:str) -> None:
+    self.plain_text = plain_text
+    self.starts = array('I', [0])
+    position = plain_text.find(' ')
+    while position != -1:
+      self.starts.append(position + 1)
+      position = plain_text.find(' ', position + 1)
+    self.formats = {}
+
+  def __len__(self) -> int:
+    return len(self.starts)
+
+  def __getitem__(self, item: int) -> 'SparseSentence.WordHandle':
+    if not 0 <= item < len(self.starts):
+      raise IndexError('word index out of range')
+    return self.WordHandle(self, item)
+
+  class WordHandle:
+    __slots__ = ('sentence', 'index')
+
+    def __init__(self, sentence: 'SparseSentence', index: int) -> None:
+      self.sentence = sentence
+      self.index = index
+
+    @property
+    def capitalize(self) -> bool:
+      return self.sentence.format_of(self.index).capitalize
+
+    @capitalize.setter
+    def capitalize(self, value: bool) -> None:
+      self.sentence.set_format(self.index, WordFormat(value))
+
+    def __repr__(self):
+      return str(self.capitalize)
+
+  def format_of(self, index: int) -> WordFormat:
+    return self.formats.get(index, self.PLAIN)
+
+  def set_format(self, index: int, token: WordFormat) -> None:
+    if token is self.PLAIN:
+      self.formats.pop(index, None)
+    else:
+      self.formats[index] = token
+
+  def word_end(self, index: int) -> int:
+    if index + 1 < len(self.starts):
+      return self.starts[index + 1] - 1
+    return len(self.plain_text)
+
+  def chunks(self):
+    """
+    Lazily yield the formatted text: untouched stretches are sliced from
+    the original string in one piece.
+    """
+    position = 0
+    for index in sorted(self.formats):
+      start = self.starts[index]
+      end = self.word_end(index)
+      yield self.plain_text[position:start]
+      yield self.formats[index].apply(self.plain_text[start:end])
+      position = end
+    yield self.plain_text[position:]
+
+  def __str__(self) -> str:
+    return ''.join(self.chunks())
+
+
 class Evaluate(TestCase):
     def test_exercise(self):
         s = Sentence('alpha beta gamma')
         s[1].capitalize = True
         self.assertEqual(str(s), 'alpha BETA gamma')
+
+    def test_sparse_sentence(self):
+        s = SparseSentence('alpha beta gamma')
+        s[1].capitalize = True
+        s[2].capitalize
+        self.assertEqual(str(s), 'alpha BETA gamma')
+        self.assertEqual(len(s.formats), 1)
+        s[0].capitalize = True
+        self.assertIs(s.formats[0], s.formats[1])
+        s[1].capitalize = False
+        self.assertEqual(str(s), 'ALPHA beta gamma')
+        self.assertEqual(len(s.formats), 1)
+
+    def test_sparse_sentence_keeps_spacing(self):
+        s = SparseSentence('a  b ')
+        s[2].capitalize = True
+        self.assertEqual(len(s), 4)
+        self.assertEqual(str(s), 'a  B ')
         
         
 if __name__ == '__main__':
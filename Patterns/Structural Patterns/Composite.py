@@ -23,6 +23,8 @@
 # - Python supports iteration with __iter__ the IterableABC.
 # - A single object can make itself iterable by yielding self from __iter__.
 ################################################
+import sys
+from collections import deque
 
 
 class GraphicObject:
@@ -35,20 +37,73 @@ class GraphicObject:
   def name(self):
     return self._name 
   
-  def _print(self, items, depth):
-    items.append('*' * depth)
-    if self.color:
-      items.append(self.color)
-    items.append(f'{self.name}\n')
-    for child in self.children:
-      child._print(items, depth + 1)
+  def line(self, depth):
+    return f"{'*' * depth}{self.color or ''}{self.name}\n"
+
+  def walk(self, order='pre'):
+    return Walk(self, order)
+
+  def chunks(self, walk=None):
+    """
+    Stream the rendering one line per node. Pass a Walk to choose the
+    order or to read its counters while (or after) rendering.
+    """
+    walk = self.walk() if walk is None else walk
+    for node, depth in walk:
+      yield node.line(depth)
   
   def __str__(self):
-    items = []
-    self._print(items, 0)
-    return ''.join(items)  
+    return ''.join(self.chunks())
   
 
+class Walk:
+  """
+  Non-recursive traversal of a GraphicObject tree with an explicit stack
+  (or queue for level order), so nesting depth is not limited by the
+  recursion limit. Yields (node, depth) and keeps `nodes` and `max_depth`
+  up to date as it goes.
+  """
+  ORDERS = ('pre', 'post', 'level')
+
+  def __init__(self, root, order='pre'):
+    if order not in self.ORDERS:
+      raise ValueError(f'order must be one of {self.ORDERS}')
+    self.root = root
+    self.order = order
+    self.nodes = 0
+    self.max_depth = 0
+
+  def _visit(self, node, depth):
+    self.nodes += 1
+    self.max_depth = max(self.max_depth, depth)
+    return node, depth
+
+  def __iter__(self):
+    self.nodes = 0
+    self.max_depth = 0
+    if self.order == 'pre':
+      stack = [(self.root, 0)]
+      while stack:
+        node, depth = stack.pop()
+        yield self._visit(node, depth)
+        stack.extend((child, depth + 1) for child in reversed(node.children))
+    elif self.order == 'post':
+      stack = [(self.root, 0, False)]
+      while stack:
+        node, depth, expanded = stack.pop()
+        if expanded:
+          yield self._visit(node, depth)
+          continue
+        stack.append((node, depth, True))
+        stack.extend((child, depth + 1, False) for child in reversed(node.children))
+    else:
+      queue = deque([(self.root, 0)])
+      while queue:
+        node, depth = queue.popleft()
+        yield self._visit(node, depth)
+        queue.extend((child, depth + 1) for child in node.children)
+
+
 class Circle(GraphicObject):
   @property
   def name(self):
@@ -76,4 +131,22 @@ if __name__ == '__main__':
     print('Composite')
     print('................................................')
     print(drawing)
-    print(group)
\ No newline at end of file
+    print(group)
+    
+    print('................................................')
+    print('Walks')
+    for order in Walk.ORDERS:
+      walk = drawing.walk(order)
+      names = [node.name for node, _ in walk]
+      print(f'{order:>5}: {names} ({walk.nodes} nodes, max depth {walk.max_depth})')
+    
+    print('................................................')
+    print('Deep scene (deeper than the recursion limit)')
+    root = node = GraphicObject()
+    for _ in range(sys.getrecursionlimit() * 10):
+      child = Circle('Green')
+      node.children.append(child)
+      node = child
+    walk = root.walk()
+    size = sum(len(chunk) for chunk in root.chunks(walk))
+    print(f'{walk.nodes} nodes, max depth {walk.max_depth}, {size:,} characters streamed')
@@ -2,19 +2,92 @@
 ################################################
 # Composite - Neural Networks
 ################################################
-from abc import ABC
+import math, random, time
+from abc import ABC, abstractmethod
+from array import array
 from collections.abc import Iterable
+from itertools import product
+from operator import mul
+
+
+def init_weight() -> float:
+  return random.uniform(-1, 1)
+
+
+# ----------------------------------------------
+# Connection modes.
+# A mode decides which (source, target) pairs connect_to creates between
+# `sources` and `targets` neurons, so only the real edges are generated.
+# ----------------------------------------------
+class AllToAll:
+  def edges(self, sources: int, targets: int):
+    return product(range(sources), range(targets))
+
+
+class OneToOne:
+  def edges(self, sources: int, targets: int):
+    if sources != targets:
+      raise ValueError(f'one-to-one needs layers of the same size, '
+                       f'got {sources} and {targets}')
+    return ((i, i) for i in range(sources))
+
+
+class RandomSparse:
+  """
+  Each target gets density * sources random inputs (rounded at random, so
+  the overall density matches on average).
+  """
+  def __init__(self, density: float, seed=None) -> None:
+    if not 0 <= density <= 1:
+      raise ValueError('density must be between 0 and 1')
+    self.density = density
+    self.random = random.Random(seed)
+
+  def edges(self, sources: int, targets: int):
+    expected = self.density * sources
+    for t in range(targets):
+      k = int(expected) + (self.random.random() < expected % 1)
+      for s in self.random.sample(range(sources), min(k, sources)):
+        yield s, t
+
+
+class Window:
+  """
+  Convolution-like: target t reads sources [t * stride, t * stride + size).
+  """
+  def __init__(self, size: int, stride: int=1) -> None:
+    self.size = size
+    self.stride = stride
+
+  def edges(self, sources: int, targets: int):
+    for t in range(targets):
+      start = t * self.stride
+      for s in range(start, min(start + self.size, sources)):
+        yield s, t
 
 
 class Connectable(Iterable, ABC):   
-  def connect_to(self, other):
+  __slots__ = ()
+
+  def connect_to(self, other, mode=None):
     if self == other:
         return
-      
-    for s in self:
-      for o in other:
-        s.outputs.append(o)
-        o.inputs.append(s)
+    
+    sources = list(self)
+    targets = list(other)
+    mode = AllToAll() if mode is None else mode
+    known = {}
+    for i, j in mode.edges(len(sources), len(targets)):
+      s, o = sources[i], targets[j]
+      if id(s) not in known:
+        known[id(s)] = {id(x) for x in s.outputs}
+      # Edges that already exist are not added twice.
+      if id(o) in known[id(s)]:
+        continue
+      known[id(s)].add(id(o))
+      s.outputs.append(o)
+      o.inputs.append(s)
+      o.weights.append(init_weight())
     
 
 class Neuron(Connectable):
@@ -22,6 +95,9 @@ class Neuron(Connectable):
     self.name = name
     self.inputs = []
     self.outputs = []
+    # weights[k] applies to inputs[k]
+    self.weights = []
+    self.bias = 0.0
     
   
   def __str__(self) -> str:
@@ -51,6 +127,472 @@ class NeuronLayer(list, Connectable):
     return f'{self.name} with {len(self)} neurons'
 
 
+# ----------------------------------------------
+# Dense layers.
+# Connecting two NeuronLayers of 10k neurons stores 100M object references.
+# Dense layers do not hold Neuron objects at all: the edges between two
+# layers live in one Connection (all-to-all is a flag, anything else a CSR
+# index of int arrays) and neurons, inputs and outputs are lazy views over
+# it. The composite API stays the same: iterate a layer, index it, connect
+# layers or single neurons, ask a neuron for its inputs/outputs.
+# ----------------------------------------------
+class Connection:
+  """
+  Edges from a source layer to a target layer. Unless `full` (all-to-all,
+  nothing stored) the edges are a CSR index: the sources feeding target t
+  are indices[indptr[t]:indptr[t + 1]], sorted and without duplicates.
+  """
+  def __init__(self, source: 'DenseNeuronLayer', target: 'DenseNeuronLayer') -> None:
+    self.source = source
+    self.target = target
+    self.full = False
+    self.indptr = None
+    self.indices = array('I')
+    self.reverse = None
+    self._weights = None
+
+  def connect_all(self) -> None:
+    if self.full:
+      return
+    old = self._weight_map()
+    self.full = True
+    self.indptr = None
+    self.indices = array('I')
+    self.reverse = None
+    self._weights = None
+    if old:
+      S = len(self.source)
+      weights = self.weights()
+      for (t, s), w in old.items():
+        weights[t * S + s] = w
+
+  def weights(self) -> array:
+    """
+    Edge weights, created on first use: a row-major target x source
+    matrix when full, otherwise parallel to indices.
+    """
+    if self._weights is None:
+      self._weights = array('d', (init_weight() for _ in range(len(self))))
+    return self._weights
+
+  def _weight_map(self) -> dict:
+    if self._weights is None or self.full:
+      return {}
+    return {(t, s): self._weights[k]
+            for t in range(len(self.target))
+            for k, s in enumerate(self.sources_of(t), self.indptr[t])}
+
+  def add_edges(self, edges) -> None:
+    """
+    Add (source index, target index) pairs. Duplicates, within the call or
+    of existing edges, are stored once. Rows without new edges are copied
+    as they are, so memory follows the real edge count.
+    """
+    if self.full:
+      return
+    new = {}
+    for s, t in edges:
+      if not (0 <= s < len(self.source) and 0 <= t < len(self.target)):
+        raise IndexError(f'edge ({s}, {t}) is out of range')
+      new.setdefault(t, set()).add(s)
+    if not new:
+      return
+    indptr = array('I', [0])
+    indices = array('I')
+    weights = None if self._weights is None else array('d')
+    for t in range(len(self.target)):
+      row = self.sources_of(t)
+      if weights is not None and self.indptr is not None:
+        row_weights = self._weights[self.indptr[t]:self.indptr[t + 1]]
+      else:
+        row_weights = ()
+      if t in new:
+        old = dict(zip(row, row_weights))
+        row = sorted(new[t].union(row))
+        row_weights = [old[s] if s in old else init_weight() for s in row]
+      indices.extend(row)
+      indptr.append(len(indices))
+      if weights is not None:
+        weights.extend(row_weights)
+    self.indptr = indptr
+    self.indices = indices
+    self.reverse = None
+    self._weights = weights
+
+  def sources_of(self, t: int):
+    if self.full:
+      return range(len(self.source))
+    if self.indptr is None:
+      return ()
+    return self.indices[self.indptr[t]:self.indptr[t + 1]]
+
+  def targets_of(self, s: int):
+    if self.full:
+      return range(len(self.target))
+    if self.indptr is None:
+      return ()
+    if self.reverse is None:
+      self.reverse = Connection.transpose(self.indptr, self.indices, len(self.source))
+    indptr, indices = self.reverse
+    return indices[indptr[s]:indptr[s + 1]]
+
+  @staticmethod
+  def transpose(indptr: array, indices: array, columns: int) -> tuple:
+    counts = array('I', [0]) * (columns + 1)
+    for s in indices:
+      counts[s + 1] += 1
+    for s in range(columns):
+      counts[s + 1] += counts[s]
+    result = array('I', [0]) * len(indices)
+    fill = array('I', counts)
+    for t in range(len(indptr) - 1):
+      for k in range(indptr[t], indptr[t + 1]):
+        s = indices[k]
+        result[fill[s]] = t
+        fill[s] += 1
+    return counts, result
+
+  def __len__(self) -> int:
+    if self.full:
+      return len(self.source) * len(self.target)
+    return len(self.indices)
+
+  def nbytes(self) -> int:
+    if self.indptr is None:
+      return 0
+    return (len(self.indptr) + len(self.indices)) * self.indices.itemsize
+
+
+class NeighbourView(Iterable):
+  """
+  Lazy inputs (or outputs) of a neuron in a dense layer.
+  """
+  def __init__(self, neuron: 'NeuronView', incoming: bool) -> None:
+    self.neuron = neuron
+    self.incoming = incoming
+
+  def _groups(self):
+    layer, i = self.neuron.layer, self.neuron.index
+    if self.incoming:
+      for c in layer.incoming.values():
+        yield c.source, c.sources_of(i)
+    else:
+      for c in layer.outgoing.values():
+        yield c.target, c.targets_of(i)
+
+  def __iter__(self):
+    for layer, indexes in self._groups():
+      for k in indexes:
+        yield NeuronView(layer, k)
+
+  def __len__(self) -> int:
+    return sum(len(indexes) for _, indexes in self._groups())
+
+
+class DenseConnectable(Connectable):
+  """
+  Connects dense layers and their neurons through Connection objects.
+  """
+  __slots__ = ()
+
+  @abstractmethod
+  def endpoint(self) -> tuple:
+    pass
+
+  def connect_to(self, other, mode=None):
+    if self == other:
+      return
+    if not isinstance(other, DenseConnectable):
+      raise TypeError('dense layers can only be connected to dense layers '
+                      'or their neurons')
+    source, rows = self.endpoint()
+    target, columns = other.endpoint()
+    connection = source.outgoing.get(target)
+    if connection is None:
+      connection = Connection(source, target)
+      source.outgoing[target] = connection
+      target.incoming[source] = connection
+    mode = AllToAll() if mode is None else mode
+    if rows is None and columns is None and isinstance(mode, AllToAll):
+      connection.connect_all()
+    else:
+      rows = range(len(source)) if rows is None else rows
+      columns = range(len(target)) if columns is None else columns
+      connection.add_edges((rows[i], columns[j])
+                           for i, j in mode.edges(len(rows), len(columns)))
+
+
+class NeuronView(DenseConnectable):
+  """
+  A neuron of a DenseNeuronLayer, created on demand.
+  """
+  __slots__ = ('layer', 'index')
+
+  def __init__(self, layer: 'DenseNeuronLayer', index: int) -> None:
+    self.layer = layer
+    self.index = index
+
+  @property
+  def name(self) -> str:
+    return f'{self.layer.name}-{self.index}'
+
+  @property
+  def inputs(self) -> NeighbourView:
+    return NeighbourView(self, incoming=True)
+
+  @property
+  def outputs(self) -> NeighbourView:
+    return NeighbourView(self, incoming=False)
+
+  def endpoint(self) -> tuple:
+    return self.layer, (self.index,)
+
+  def __eq__(self, other) -> bool:
+    return (isinstance(other, NeuronView) and
+            self.layer is other.layer and self.index == other.index)
+
+  def __hash__(self) -> int:
+    return hash((id(self.layer), self.index))
+
+  def __str__(self) -> str:
+    return f'{self.name}, ' \
+           f'{len(self.inputs)} inputs, ' \
+           f'{len(self.outputs)} outputs'
+
+  def __iter__(self):
+    yield self
+
+
+class DenseNeuronLayer(DenseConnectable):
+  def __init__(self, name: str, count: int) -> None:
+    self.name = name
+    self.count = count
+    self.incoming = {}
+    self.outgoing = {}
+    self.biases = None
+
+  def bias(self) -> array:
+    if self.biases is None:
+      self.biases = array('d', [0.0]) * self.count
+    return self.biases
+
+  def endpoint(self) -> tuple:
+    return self, None
+
+  def __len__(self) -> int:
+    return self.count
+
+  def __getitem__(self, index: int) -> NeuronView:
+    if index < 0:
+      index += self.count
+    if not 0 <= index < self.count:
+      raise IndexError('neuron index out of range')
+    return NeuronView(self, index)
+
+  def __iter__(self):
+    for index in range(self.count):
+      yield NeuronView(self, index)
+
+  # Layers are compared by identity (they key the connection dicts).
+  __eq__ = object.__eq__
+  __hash__ = object.__hash__
+
+  def __str__(self) -> str:
+    return f'{self.name} with {self.count} neurons'
+
+
+# ----------------------------------------------
+# Forward pass.
+# Network compiles the graph once into steps in topological order. Every
+# dense layer is one step, and plain neurons that read the same inputs (a
+# NeuronLayer connected to another one) are grouped into one step too. Each
+# step owns a slot range in a flat value vector and is computed as bias plus
+# one matrix product per incoming connection. forward() then pushes a whole
+# batch of input vectors through those steps. Weights are copied when
+# compiling: compile again after changing them.
+# ----------------------------------------------
+class Network:
+  def __init__(self, inputs: list, outputs: list, activation=math.tanh) -> None:
+    self.activation = activation
+    self.slots = {}
+    self.size = 0
+    self.input_blocks = [b for c in inputs for b in Network.blocks(c)]
+    for block in self.input_blocks:
+      self._assign(block)
+    self.input_size = self.size
+    self.steps = []
+    for group in Network.group(self._order(outputs)):
+      for block in group:
+        self._assign(block)
+      self.steps.append(self._compile(group))
+    self.output_slots = [slot for c in outputs for slot in self._output_slots(c)]
+
+  @staticmethod
+  def blocks(connectable) -> list:
+    """
+    Units of computation: a dense layer as a whole, plain neurons one by one.
+    """
+    if isinstance(connectable, DenseNeuronLayer):
+      return [connectable]
+    if isinstance(connectable, NeuronView):
+      return [connectable.layer]
+    return list(connectable)
+
+  @staticmethod
+  def sources(block) -> list:
+    if isinstance(block, DenseNeuronLayer):
+      return list(block.incoming)
+    return list({id(n): n for n in block.inputs}.values())
+
+  @staticmethod
+  def group(order: list) -> list:
+    """
+    Merge plain neurons with identical inputs into one group, placed where
+    its first member was (all of its inputs are computed by then).
+    """
+    groups = []
+    by_inputs = {}
+    for block in order:
+      if isinstance(block, DenseNeuronLayer):
+        groups.append([block])
+        continue
+      key = tuple(map(id, block.inputs))
+      if key in by_inputs:
+        by_inputs[key].append(block)
+      else:
+        by_inputs[key] = [block]
+        groups.append(by_inputs[key])
+    return groups
+
+  def _assign(self, block) -> None:
+    self.slots[block] = self.size
+    self.size += len(block) if isinstance(block, DenseNeuronLayer) else 1
+
+  def _order(self, outputs: list) -> list:
+    order = []
+    done = set(self.input_blocks)
+    visiting = set()
+    for root in (b for c in outputs for b in Network.blocks(c)):
+      stack = [(root, False)]
+      while stack:
+        block, expanded = stack.pop()
+        if expanded:
+          visiting.discard(block)
+          done.add(block)
+          order.append(block)
+          continue
+        if block in done:
+          continue
+        if block in visiting:
+          raise ValueError('cannot compile a network with cycles')
+        visiting.add(block)
+        stack.append((block, True))
+        stack.extend((s, False) for s in Network.sources(block) if s not in done)
+    return order
+
+  def _output_slots(self, connectable) -> list:
+    if isinstance(connectable, NeuronView):
+      return [self.slots[connectable.layer] + connectable.index]
+    slots = []
+    for block in Network.blocks(connectable):
+      width = len(block) if isinstance(block, DenseNeuronLayer) else 1
+      slots.extend(range(self.slots[block], self.slots[block] + width))
+    return slots
+
+  def _compile(self, group: list) -> tuple:
+    """
+    A step is (first slot, biases, products, sparse rows).
+    A product is (gather, weight rows): gather is a slice of the value
+    vector or an array of slots. Sparse rows are (target offset, source
+    slots, weights).
+    """
+    block = group[0]
+    if not isinstance(block, DenseNeuronLayer):
+      gather = array('I', [self.slots[n] for n in block.inputs])
+      rows = [array('d', n.weights) for n in group]
+      biases = array('d', [n.bias for n in group])
+      return self.slots[block], biases, [(gather, rows)], []
+    products, sparse = [], []
+    for source, connection in block.incoming.items():
+      first = self.slots[source]
+      weights = connection.weights()
+      if connection.full:
+        width = len(source)
+        rows = [weights[t * width:(t + 1) * width] for t in range(len(block))]
+        products.append((slice(first, first + width), rows))
+      elif connection.indptr is not None:
+        for t in range(len(block)):
+          lo, hi = connection.indptr[t], connection.indptr[t + 1]
+          if lo < hi:
+            slots = array('I', (first + s for s in connection.indices[lo:hi]))
+            sparse.append((t, slots, weights[lo:hi]))
+    return self.slots[block], array('d', block.bias()), products, sparse
+
+  def forward(self, batch: list) -> list:
+    """
+    Evaluate a batch of input vectors (one value per input neuron, in the
+    order the inputs were given). Returns one output vector per sample.
+    """
+    values = []
+    for x in batch:
+      if len(x) != self.input_size:
+        raise ValueError(f'expected {self.input_size} inputs, got {len(x)}')
+      v = array('d', x)
+      v.extend(array('d', [0.0]) * (self.size - self.input_size))
+      values.append(v)
+    activation = self.activation
+    for first, biases, products, sparse in self.steps:
+      for v in values:
+        acc = array('d', biases)
+        for gather, rows in products:
+          if isinstance(gather, slice):
+            x = v[gather]
+          else:
+            x = array('d', map(v.__getitem__, gather))
+          for t, row in enumerate(rows):
+            acc[t] += sum(map(mul, row, x))
+        for t, slots, weights in sparse:
+          acc[t] += sum(map(mul, weights, map(v.__getitem__, slots)))
+        v[first:first + len(acc)] = array('d', map(activation, acc))
+    return [[v[i] for i in self.output_slots] for v in values]
+
+
+def naive_forward(layers: list, x: list, activation=math.tanh) -> list:
+  """
+  Reference forward pass: one Python loop per neuron over plain
+  NeuronLayers given in order (the first one is the input layer).
+  """
+  values = {id(n): value for n, value in zip(layers[0], x)}
+  for layer in layers[1:]:
+    for n in layer:
+      total = n.bias
+      for i, w in zip(n.inputs, n.weights):
+        total += w * values[id(i)]
+      values[id(n)] = activation(total)
+  return [values[id(n)] for n in layers[-1]]
+
+
+def benchmark_forward(sizes=(64, 128, 128, 10), batch_size=256) -> None:
+  layers = [NeuronLayer(f'B{k}', size) for k, size in enumerate(sizes)]
+  for a, b in zip(layers, layers[1:]):
+    a.connect_to(b)
+  batch = [[random.uniform(-1, 1) for _ in range(sizes[0])]
+           for _ in range(batch_size)]
+  network = Network([layers[0]], [layers[-1]])
+
+  start = time.perf_counter()
+  expected = [naive_forward(layers, x) for x in batch]
+  naive = time.perf_counter() - start
+  start = time.perf_counter()
+  result = network.forward(batch)
+  compiled = time.perf_counter() - start
+
+  error = max(abs(a - b) for r, e in zip(result, expected) for a, b in zip(r, e))
+  print(f'Layers {sizes}, batch of {batch_size} (max difference {error:.1e})')
+  print(f'Per-neuron loop: {batch_size / naive:,.0f} samples/s')
+  print(f'Compiled:        {batch_size / compiled:,.0f} samples/s')
+
+
 # def connect_to(self, other):
 #   """
 #   Classes are always the best option.
@@ -87,4 +629,50 @@ if __name__ == '__main__':
   print(layer1)
   print(layer2)
   print(layer1[0])
-  
\ No newline at end of file
+  
+  print('................................................')
+  print('Dense layers (connectivity stored as one Connection per layer pair)')
+  dense1 = DenseNeuronLayer('D1', 10_000)
+  dense2 = DenseNeuronLayer('D2', 10_000)
+  dense3 = DenseNeuronLayer('D3', 5)
+  dense1.connect_to(dense2)
+  dense2[0].connect_to(dense3)
+  dense3.connect_to(dense2[1])
+  print(dense1)
+  print(dense2)
+  print(dense2[0])
+  print(dense2[1])
+  print(dense3[4])
+  print(f'{len(dense1.outgoing[dense2])} edges in '
+        f'{dense1.outgoing[dense2].nbytes()} bytes of index arrays')
+  
+  print('................................................')
+  print('Forward pass')
+  network = Network([neuron1], [neuron2, layer2])
+  print(network.forward([[0.5], [-0.5]]))
+  d_in = DenseNeuronLayer('In', 4)
+  d_hidden = DenseNeuronLayer('Hidden', 8)
+  d_out = DenseNeuronLayer('Out', 2)
+  d_in.connect_to(d_hidden)
+  d_hidden.connect_to(d_out)
+  d_in[0].connect_to(d_out[1])
+  network = Network([d_in], [d_out])
+  print(network.forward([[1, 0, 0, 0], [0, 1, 0, 0]]))
+  benchmark_forward()
+  
+  print('................................................')
+  print('Connection modes (edges stored once, memory follows the edge count)')
+  layer1.connect_to(layer2)
+  print(f'{layer2[0]} (after connecting L1 to L2 twice)')
+  sparse1 = DenseNeuronLayer('S1', 10_000)
+  sparse2 = DenseNeuronLayer('S2', 10_000)
+  sparse1.connect_to(sparse2, RandomSparse(0.001, seed=1))
+  sparse1.connect_to(sparse2, OneToOne())
+  sparse1.connect_to(sparse2, OneToOne())
+  connection = sparse1.outgoing[sparse2]
+  print(f'random sparse + one-to-one: {len(connection)} edges in '
+        f'{connection.nbytes():,} bytes')
+  conv1 = DenseNeuronLayer('C1', 16)
+  conv2 = DenseNeuronLayer('C2', 7)
+  conv1.connect_to(conv2, Window(4, stride=2))
+  print([[n.name for n in conv2[t].inputs] for t in (0, 6)])
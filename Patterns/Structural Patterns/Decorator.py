@@ -28,7 +28,7 @@
 # Python's functional decorators wrap functions; no direct relation to 
 # the Gang of Four (GoF) Decorator pattern. 
 ################################################
-import time
+import asyncio, functools, inspect, json, threading, time, weakref
 
 def some_op():
   print('Starting op')
@@ -39,13 +39,201 @@ def some_op():
 
 # Defining a new decorator
 def time_it(func):
-  def wrapper():
-    start = time.time()
-    result = func()
-    end = time.time()
-    print(f'{func.__name__} took {int((end - start)*1000)}ms')
+  @functools.wraps(func)
+  def wrapper(*args, **kwargs):
+    start = time.perf_counter_ns()
+    result = func(*args, **kwargs)
+    end = time.perf_counter_ns()
+    print(f'{func.__name__} took {(end - start) // 1_000_000}ms')
     return result
   return wrapper
+
+
+# ----------------------------------------------
+# Production profiling built on the same idea.
+# @profiled records call durations instead of printing them. Each thread
+# writes into its own histograms (no lock on the hot path); the registry
+# merges them only when stats are read. Histograms use log-linear buckets
+# (8 per power of two, so a percentile is within 12.5% of the real value).
+# With sample_every=N only one call in N is timed; every call is counted.
+# When a thread ends its histograms are folded into a retired total, so
+# thread churn does not keep growing the registry.
+# ----------------------------------------------
+class Histogram:
+  SUB_BUCKETS = 8
+
+  def __init__(self):
+    self.counts = {}
+    self.calls = 0
+    self.samples = 0
+    self.total = 0
+    self.max = 0
+
+  @classmethod
+  def bucket(cls, ns):
+    if ns < cls.SUB_BUCKETS:
+      return ns
+    shift = ns.bit_length() - 4
+    return (shift + 1) * cls.SUB_BUCKETS + (ns >> shift) - cls.SUB_BUCKETS
+
+  @classmethod
+  def bucket_value(cls, bucket):
+    """
+    Upper bound of the durations in a bucket.
+    """
+    if bucket < cls.SUB_BUCKETS:
+      return bucket
+    shift = bucket // cls.SUB_BUCKETS - 1
+    return ((bucket % cls.SUB_BUCKETS + cls.SUB_BUCKETS + 1) << shift) - 1
+
+  def record(self, ns):
+    b = self.bucket(ns)
+    self.counts[b] = self.counts.get(b, 0) + 1
+    self.samples += 1
+    self.total += ns
+    if ns > self.max:
+      self.max = ns
+
+  def merge(self, other):
+    # other may belong to a thread still recording: copy its buckets first
+    # (a single C-level step), never iterate the live dict.
+    for b, count in list(other.counts.items()):
+      self.counts[b] = self.counts.get(b, 0) + count
+    self.calls += other.calls
+    self.samples += other.samples
+    self.total += other.total
+    self.max = max(self.max, other.max)
+
+  def percentile(self, p):
+    if not self.samples:
+      return 0
+    rank = p / 100 * self.samples
+    seen = 0
+    for b in sorted(self.counts):
+      seen += self.counts[b]
+      if seen >= rank:
+        return min(self.bucket_value(b), self.max)
+    return self.max
+
+  def summary(self):
+    return {
+      'calls': self.calls,
+      'samples': self.samples,
+      'mean_ns': self.total // self.samples if self.samples else 0,
+      'p50_ns': self.percentile(50),
+      'p95_ns': self.percentile(95),
+      'p99_ns': self.percentile(99),
+      'max_ns': self.max,
+    }
+
+
+class ThreadMarker:
+  """
+  Lives in a thread's local storage; its finalizer runs when the thread
+  ends.
+  """
+  __slots__ = ('__weakref__',)
+
+
+class Profiler:
+  def __init__(self):
+    self.local = threading.local()
+    self.lock = threading.Lock()
+    self.per_thread = {}
+    self.retired = {}
+
+  def histogram(self, name):
+    histograms = getattr(self.local, 'histograms', None)
+    if histograms is None:
+      histograms = self.local.histograms = {}
+      marker = self.local.marker = ThreadMarker()
+      with self.lock:
+        self.per_thread[id(histograms)] = histograms
+      weakref.finalize(marker, self._retire, histograms)
+    h = histograms.get(name)
+    if h is None:
+      h = histograms[name] = Histogram()
+    return h
+
+  def _retire(self, histograms):
+    with self.lock:
+      if self.per_thread.pop(id(histograms), None) is None:
+        return
+      for name, h in histograms.items():
+        self.retired.setdefault(name, Histogram()).merge(h)
+
+  def stats(self):
+    merged = {}
+    with self.lock:
+      tables = list(self.per_thread.values())
+      for name, h in self.retired.items():
+        merged.setdefault(name, Histogram()).merge(h)
+    for histograms in tables:
+      for name, h in list(histograms.items()):
+        merged.setdefault(name, Histogram()).merge(h)
+    return {name: h.summary() for name, h in merged.items()}
+
+  def export_json(self, path=None):
+    """
+    Aggregated stats as JSON, written to path when given.
+    """
+    text = json.dumps(self.stats(), indent=2, sort_keys=True)
+    if path is not None:
+      with open(path, 'w') as f:
+        f.write(text)
+    return text
+
+  def reset(self):
+    with self.lock:
+      for histograms in self.per_thread.values():
+        histograms.clear()
+      self.retired.clear()
+
+
+profiler = Profiler()
+
+
+def profiled(func=None, *, name=None, sample_every=1, registry=None):
+  """
+  Record call durations of any function (sync or async) into a Profiler.
+  Usable as @profiled or @profiled(sample_every=100).
+  """
+  if func is None:
+    return functools.partial(profiled, name=name, sample_every=sample_every,
+                             registry=registry)
+  registry = profiler if registry is None else registry
+  name = func.__qualname__ if name is None else name
+  clock = time.perf_counter_ns
+
+  def should_time():
+    h = registry.histogram(name)
+    h.calls += 1
+    return h if h.calls % sample_every == 0 else None
+
+  if inspect.iscoroutinefunction(func):
+    @functools.wraps(func)
+    async def async_wrapper(*args, **kwargs):
+      h = should_time()
+      if h is None:
+        return await func(*args, **kwargs)
+      start = clock()
+      try:
+        return await func(*args, **kwargs)
+      finally:
+        h.record(clock() - start)
+    return async_wrapper
+
+  @functools.wraps(func)
+  def wrapper(*args, **kwargs):
+    h = should_time()
+    if h is None:
+      return func(*args, **kwargs)
+    start = clock()
+    try:
+      return func(*args, **kwargs)
+    finally:
+      h.record(clock() - start)
+  return wrapper
     
 
 # Applyint the new decorator
@@ -57,6 +245,26 @@ def some_op_d():
   return 123
 
 
+@profiled
+def add(a, b=1):
+  return a + b
+
+
+@profiled(sample_every=10)
+def busy(n):
+  return sum(range(n))
+
+
+@profiled
+async def fetch(delay):
+  await asyncio.sleep(delay)
+  return delay
+
+
+async def fetch_all(delays):
+  return await asyncio.gather(*(fetch(d) for d in delays))
+
+
 if __name__ == '__main__':
   print('................................................')
   print('Normal behavior of a funtion (without decorator):')
@@ -71,4 +279,16 @@ if __name__ == '__main__':
   some_op_d()
   
   print('................................................')
-  
\ No newline at end of file
+  print('Profiling decorator (histograms, sampling, async, JSON):')
+  for i in range(10_000):
+    add(i, b=2)
+  workers = [threading.Thread(target=lambda: [busy(1000) for _ in range(2000)])
+             for _ in range(4)]
+  for w in workers:
+    w.start()
+  for w in workers:
+    w.join()
+  asyncio.run(fetch_all([0.01 * i for i in range(5)]))
+  print(profiler.export_json())
+  
+  print('................................................')
@@ -2,13 +2,86 @@
 ################################################
 # Dynamic Decorator
 ################################################
-class FileWithLogging:
-  def __init__(self, file):
-    self.file = file
+import atexit, os, tempfile, threading, time
+from collections import deque
+
+
+# Base for dynamic decorators: every attribute the decorator does not have
+# is forwarded to the decorated object. Methods are resolved once and stored
+# on the instance, so the next call finds them directly and skips
+# __getattr__; data attributes (e.g. file.closed) are always read live.
+class DynamicDecorator:
+  def __init__(self, target):
+    self.__dict__['target'] = target
+    self.__dict__['cached'] = set()
+
+  def forget_methods(self):
+    for item in self.__dict__['cached']:
+      del self.__dict__[item]
+    self.__dict__['cached'] = set()
+
+  def __getattr__(self, item):
+    value = getattr(self.__dict__['target'], item)
+    if callable(value) and not item.startswith('__'):
+      self.__dict__[item] = value
+      self.__dict__['cached'].add(item)
+    return value
+
+  def __setattr__(self, key, value):
+    if key in self.__dict__ and key not in self.__dict__['cached'] \
+        or hasattr(type(self), key):
+      object.__setattr__(self, key, value)
+    else:
+      self._forget(key)
+      setattr(self.__dict__['target'], key, value)
+
+  def __delattr__(self, item):
+    self._forget(item)
+    delattr(self.__dict__['target'], item)
+
+  def _forget(self, item):
+    # A cached method shadowing the target's attribute would outlive it.
+    if item in self.__dict__['cached']:
+      self.__dict__['cached'].discard(item)
+      del self.__dict__[item]
+
+
+class FileWithLogging(DynamicDecorator):
+  """
+  writelines is buffered: lines are written (and logged) once flush_size
+  lines are pending. Any other call on the file writes them out first.
+  """
+  def __init__(self, file, flush_size=1):
+    super().__init__(file)
+    self.__dict__['flush_size'] = flush_size
+    self.__dict__['pending'] = []
+
+  @property
+  def file(self):
+    return self.target
+
+  @file.setter
+  def file(self, value):
+    self.flush_lines()
+    self.__dict__['target'] = value
+    self.forget_methods()
   
   def writelines(self, strings):
-    self.file.writelines(strings)
-    print(f'wrote {len(strings)} lines')
+    pending = self.pending
+    was_empty = not pending
+    pending.extend(strings)
+    if len(pending) >= self.flush_size:
+      self.flush_lines()
+    elif was_empty:
+      # Cached methods would bypass the pending lines, forget them.
+      self.forget_methods()
+
+  def flush_lines(self):
+    pending = self.pending
+    if pending:
+      self.target.writelines(pending)
+      print(f'wrote {len(pending)} lines')
+      self.__dict__['pending'] = []
   
   # dynamic code
   # whatever other calls, they were proxy over to underlying file methods.
@@ -18,22 +91,174 @@ class FileWithLogging:
   # #   self.file.write(item)
     
   def __iter__(self):
-    return self.file.__iter__()
+    self.flush_lines()
+    return self.target.__iter__()
   
   def __next__(self):
-    return self.file.__next__()
+    self.flush_lines()
+    return self.target.__next__()
 
   def __getattr__(self, item):
-    return getattr(self.__dict__['file'], item)
+    if self.__dict__.get('pending'):
+      self.flush_lines()
+    return super().__getattr__(item)
+
+
+# Asynchronous variant: write/writelines only put the strings in a bounded
+# buffer; a background thread waits until batch_size items are pending (or
+# interval seconds passed, or someone drains) and writes them as one block.
+# When the buffer is full writers wait for room (backpressure) and the wait
+# is counted as a stall. A file still open when the interpreter exits is
+# closed (drained) by an atexit hook, so buffered writes are not lost.
+class AsyncFileWithLogging(DynamicDecorator):
+  def __init__(self, file, capacity=4096, batch_size=None, interval=0.05,
+               log=print):
+    super().__init__(file)
+    self.__dict__.update(
+      capacity=capacity, log=log, buffer=deque(), busy=False, closed_=False,
+      batch_size=capacity // 2 if batch_size is None else batch_size,
+      interval=interval, draining=0, bytes=0, batches=0, stalls=0,
+      error=None, lock=threading.Lock())
+    self.__dict__['condition'] = threading.Condition(self.lock)
+    self.__dict__['thread'] = threading.Thread(target=self._run, daemon=True)
+    self.thread.start()
+    atexit.register(self.close)
+
+  def _put(self, items):
+    # The plain lock is the condition's own lock, and cheaper to enter.
+    with self.lock:
+      if self.closed_:
+        raise ValueError('I/O operation on closed file.')
+      # The writer thread only needs waking when the buffer stops being
+      # empty (it then starts its interval) or first reaches batch_size.
+      before = len(self.buffer)
+      for item in items:
+        if len(self.buffer) >= self.capacity:
+          self.__dict__['stalls'] += 1
+          self.condition.notify_all()
+          self.condition.wait_for(lambda: len(self.buffer) < self.capacity)
+          before = 0
+        self.buffer.append(item)
+      after = len(self.buffer)
+      if before == 0 or before < self.batch_size <= after:
+        self.condition.notify_all()
+
+  def write(self, s):
+    self._put((s,))
+    return len(s)
+
+  def writelines(self, strings):
+    self._put(strings)
+
+  def _run(self):
+    while True:
+      with self.condition:
+        self.condition.wait_for(lambda: self.buffer or self.closed_)
+        self.condition.wait_for(
+          lambda: len(self.buffer) >= self.batch_size or self.closed_
+                  or self.draining, self.interval)
+        if not self.buffer:
+          return
+        items = list(self.buffer)
+        self.buffer.clear()
+        self.__dict__['busy'] = True
+        self.condition.notify_all()
+      block = ''.join(items)
+      try:
+        self.target.write(block)
+      except Exception as e:
+        self.__dict__['error'] = e
+      with self.condition:
+        self.__dict__['bytes'] += len(block)
+        self.__dict__['batches'] += 1
+        self.__dict__['busy'] = False
+        self.condition.notify_all()
+      if self.log:
+        self.log(f'wrote {len(items)} items ({len(block)} characters) in one batch')
+
+  def _wait_drained(self):
+    # Called holding the lock; returns with it held and nothing pending,
+    # so the writer thread is not using the file until it is released.
+    self.__dict__['draining'] += 1
+    self.condition.notify_all()
+    self.condition.wait_for(lambda: not self.buffer and not self.busy)
+    self.__dict__['draining'] -= 1
+    if self.error is not None:
+      raise self.error
+
+  def drain(self):
+    """
+    Wait until everything written so far reached the file.
+    """
+    with self.condition:
+      self._wait_drained()
+
+  def flush(self):
+    with self.condition:
+      self._wait_drained()
+      self.target.flush()
+
+  def close(self):
+    with self.condition:
+      if self.closed_:
+        return
+      self.__dict__['closed_'] = True
+      self.condition.notify_all()
+    atexit.unregister(self.close)
+    self.thread.join()
+    self.target.close()
+    if self.error is not None:
+      raise self.error
+
+  def stats(self):
+    with self.condition:
+      return {'bytes': self.bytes, 'batches': self.batches,
+              'stalls': self.stalls, 'pending': len(self.buffer)}
+
+  def __getattr__(self, item):
+    # Anything else (seek, tell, read, ...) sees the file with all
+    # pending writes applied and runs under the lock, so it never overlaps
+    # a batch being written. Methods are not cached on the instance: each
+    # call has to drain again.
+    value = getattr(self.target, item)
+    if not callable(value):
+      with self.condition:
+        self._wait_drained()
+        return getattr(self.target, item)
+
+    def call(*args, **kwargs):
+      with self.condition:
+        self._wait_drained()
+        return value(*args, **kwargs)
+    return call
+
+
+def benchmark_writes(n=200_000):
+  """
+  Per-write cost of the raw file, a decorator resolving write through
+  __getattr__ on every call and the caching decorator.
+  """
+  class Uncached:
+    def __init__(self, file):
+      self.__dict__['file'] = file
+
+    def __getattr__(self, item):
+      return getattr(self.__dict__['file'], item)
+
+  wrappers = [('raw file', lambda f: f),
+              ('__getattr__ each call', Uncached),
+              ('cached methods', FileWithLogging)]
+  with tempfile.TemporaryDirectory() as directory:
+    path = os.path.join(directory, 'benchmark.txt')
+    for name, wrap in wrappers:
+      with open(path, 'w') as f:
+        file = wrap(f)
+        start = time.perf_counter()
+        for _ in range(n):
+          file.write('x')
+        elapsed = time.perf_counter() - start
+      print(f'{name:>22}: {elapsed / n * 1e9:.0f}ns per write')
 
-  def __setattr__(self, key, value):
-    if key == 'file':
-      self.__dict__[key] = value
-    else:
-      setattr(self.__dict__['file'], key)
-      
-  def __delattr__(self, item):
-    delattr(self.__dict__['file'], item)
 
 if __name__ == '__main__':
   print('................................................')
@@ -51,3 +276,37 @@ if __name__ == '__main__':
     print(f.read())
     
   print('................................................')
+  print('Buffered writelines (flushed every 1000 lines):')
+  
+  with tempfile.TemporaryDirectory() as directory:
+    buffered_name = os.path.join(directory, 'buffered.txt')
+    file = FileWithLogging(open(buffered_name, 'w'), flush_size=1000)
+    for i in range(2500):
+      file.writelines([f'line {i}\n'])
+    file.write('last line\n')
+    file.close()
+    with open(buffered_name) as f:
+      lines = f.readlines()
+    print(f'{len(lines)} lines in the file, ending with {lines[-2:]}')
+  
+  print('................................................')
+  print('Asynchronous writes (background flush thread):')
+  
+  with tempfile.TemporaryDirectory() as directory:
+    async_name = os.path.join(directory, 'async.txt')
+    file = AsyncFileWithLogging(open(async_name, 'w'), capacity=10_000, log=None)
+    start = time.perf_counter()
+    for i in range(100_000):
+      file.write(f'line {i}\n')
+    elapsed = time.perf_counter() - start
+    file.close()
+    with open(async_name) as f:
+      print(f'{sum(1 for _ in f)} lines in the file, '
+            f'{elapsed / 100_000 * 1e9:.0f}ns per write call')
+    print(file.stats())
+  
+  print('................................................')
+  print('Benchmark:')
+  benchmark_writes()
+  
+  print('................................................')
@@ -29,17 +29,214 @@
 ################################################
 
 
+from array import array
+from bisect import bisect_left
+from itertools import chain
+import time
+
+
+# Prefix sums over the chunks (Fenwick tree): the sum of the first i values,
+# a change of one value and finding the chunk holding a position are O(log n).
+class PrefixSums:
+  def __init__(self, values=()) -> None:
+    self.tree = [0]
+    for value in values:
+      self.append(value)
+
+  def __len__(self) -> int:
+    return len(self.tree) - 1
+
+  def append(self, value: int) -> None:
+    i = len(self.tree)
+    self.tree.append(value + self.prefix(i - 1) - self.prefix(i - (i & -i)))
+
+  def add(self, i: int, delta: int) -> None:
+    i += 1
+    while i < len(self.tree):
+      self.tree[i] += delta
+      i += i & -i
+
+  def prefix(self, i: int) -> int:
+    total = 0
+    while i > 0:
+      total += self.tree[i]
+      i -= i & -i
+    return total
+
+  def find(self, value: int) -> tuple:
+    """
+    (i, rest): value falls in the i-th item, rest is what is left of it
+    after the sum of the items before.
+    """
+    i, step = 0, 1 << (len(self.tree) - 1).bit_length()
+    while step:
+      if i + step < len(self.tree) and self.tree[i + step] <= value:
+        i += step
+        value -= self.tree[i]
+      step >>= 1
+    return i, value
+
+
+# Text kept in chunks of up to CHUNK characters (never one big string), so
+# writing copies at most a chunk. While text is only appended every chunk
+# but the last is full and a character is found by a division, O(1); once
+# something was inserted in the middle the chunk is found through the prefix
+# sums, O(log n), until compact(). The positions of the newlines are kept
+# per chunk, and their counts in prefix sums, to find lines in O(log n).
+class ChunkedText:
+  CHUNK = 1024
+
+  def __init__(self, text: str='') -> None:
+    self.chunks = []
+    self.newlines = []
+    self.lengths = PrefixSums()
+    self.line_counts = PrefixSums()
+    self.length = 0
+    self.uniform = True
+    self.append(text)
+
+  def __len__(self) -> int:
+    return self.length
+
+  def __iter__(self):
+    return chain.from_iterable(self.chunks)
+
+  def __str__(self) -> str:
+    return ''.join(self.chunks)
+
+  def _add_chunk(self, text: str) -> None:
+    self.chunks.append(text)
+    self.newlines.append(self._find_newlines(text))
+    self.lengths.append(len(text))
+    self.line_counts.append(len(self.newlines[-1]))
+
+  def _set_chunk(self, i: int, text: str) -> None:
+    newlines = self._find_newlines(text)
+    self.lengths.add(i, len(text) - len(self.chunks[i]))
+    self.line_counts.add(i, len(newlines) - len(self.newlines[i]))
+    self.chunks[i] = text
+    self.newlines[i] = newlines
+
+  @staticmethod
+  def _find_newlines(text: str) -> array:
+    positions = array('I')
+    i = text.find('\n')
+    while i != -1:
+      positions.append(i)
+      i = text.find('\n', i + 1)
+    return positions
+
+  def append(self, text: str) -> None:
+    if not text:
+      return
+    self.length += len(text)
+    if self.chunks and len(self.chunks[-1]) < self.CHUNK:
+      room = self.CHUNK - len(self.chunks[-1])
+      self._set_chunk(len(self.chunks) - 1, self.chunks[-1] + text[:room])
+      text = text[room:]
+    for i in range(0, len(text), self.CHUNK):
+      self._add_chunk(text[i:i + self.CHUNK])
+
+  def insert(self, index: int, text: str) -> None:
+    if index >= self.length:
+      return self.append(text)
+    if not text:
+      return
+    i, offset = self._locate(index)
+    chunk = self.chunks[i]
+    chunk = chunk[:offset] + text + chunk[offset:]
+    self.length += len(text)
+    self.uniform = False
+    if len(chunk) <= 2 * self.CHUNK:
+      self._set_chunk(i, chunk)
+    else:
+      # Split the grown chunk; the prefix sums are built again (O(chunks)),
+      # which happens at most once per CHUNK inserted characters.
+      pieces = [chunk[j:j + self.CHUNK] for j in range(0, len(chunk), self.CHUNK)]
+      self.chunks[i:i + 1] = pieces
+      self.newlines[i:i + 1] = map(self._find_newlines, pieces)
+      self.lengths = PrefixSums(map(len, self.chunks))
+      self.line_counts = PrefixSums(map(len, self.newlines))
+
+  def compact(self) -> None:
+    """
+    Refill the chunks after inserts, so that char_at is O(1) again.
+    """
+    text = str(self)
+    self.__init__(text)
+
+  def _locate(self, index: int) -> tuple:
+    if index < 0:
+      index += self.length
+    if not 0 <= index < self.length:
+      raise IndexError('text index out of range')
+    if self.uniform:
+      return divmod(index, self.CHUNK)
+    return self.lengths.find(index)
+
+  def char_at(self, index: int) -> str:
+    i, offset = self._locate(index)
+    return self.chunks[i][offset]
+
+  def slice(self, start: int, stop: int) -> str:
+    """
+    The text from start to stop, copying only the chunks it spans.
+    """
+    start, stop = max(start, 0), min(stop, self.length)
+    if start >= stop:
+      return ''
+    i, offset = self._locate(start)
+    parts, size = [], stop - start
+    while size > 0:
+      part = self.chunks[i][offset:offset + size]
+      parts.append(part)
+      size -= len(part)
+      i, offset = i + 1, 0
+    return ''.join(parts)
+
+  @property
+  def line_count(self) -> int:
+    return self.line_counts.prefix(len(self.line_counts)) + 1
+
+  def line_start(self, line: int) -> int:
+    """
+    Index of the first character of the line (0-based).
+    """
+    if line <= 0:
+      return 0
+    if line >= self.line_count:
+      return self.length
+    i, rest = self.line_counts.find(line - 1)
+    return self.lengths.prefix(i) + self.newlines[i][rest] + 1
+
+  def line_of(self, index: int) -> int:
+    i, offset = self._locate(index)
+    return self.line_counts.prefix(i) + bisect_left(self.newlines[i], offset)
+
+  def line(self, line: int) -> str:
+    start = self.line_start(line)
+    stop = self.line_start(line + 1)
+    return self.slice(start, stop).rstrip('\n') if line < self.line_count else ''
+
+
 class Buffer:
   def __init__(self, width: int=30, height: int=20) -> None:
     self.width = width
     self.height = height
-    self.buffer = ''
+    self.buffer = ChunkedText()
     
-  def __getitem__(self, item: str) -> str:
-    return self.buffer.__getitem__(item)
+  def __getitem__(self, item) -> str:
+    if isinstance(item, slice):
+      start, stop, step = item.indices(len(self.buffer))
+      text = self.buffer.slice(start, stop) if start < stop else ''
+      return text if step == 1 else str(self.buffer)[item]
+    return self.buffer.char_at(item)
+
+  def __len__(self) -> int:
+    return len(self.buffer)
   
   def write(self, text: str) -> None:
-    self.buffer += text
+    self.buffer.append(text)
   
   def __str__(self) -> str:
     return ','.join(self.buffer)
@@ -56,6 +253,33 @@ class Viewport:
   def append(self, text: str) -> None:
     # self.buffer += text
     self.buffer.write(text)
+
+  @property
+  def line(self) -> int:
+    text = self.buffer.buffer
+    if self.offset < len(text):
+      return text.line_of(self.offset)
+    return text.line_count - 1
+
+  def scroll_to(self, line: int) -> None:
+    self.offset = self.buffer.buffer.line_start(line)
+
+  def scroll(self, lines: int) -> None:
+    self.scroll_to(max(self.line + lines, 0))
+
+  def visible_lines(self) -> list:
+    """
+    The lines on screen, cut to the buffer's width; only those are read.
+    """
+    text, width, first = self.buffer.buffer, self.buffer.width, self.line
+    last = min(first + self.buffer.height, text.line_count)
+    lines = []
+    start = text.line_start(first)
+    for line in range(first, last):
+      stop = text.line_start(line + 1)
+      lines.append(text.slice(start, min(stop, start + width)).rstrip('\n'))
+      start = stop
+    return lines
     
 
 # Building a facade.
@@ -74,6 +298,34 @@ class Console:
     return self.current_viewport.get_char_at(index)
 
 
+def benchmark_console(lines: int=20_000) -> None:
+  """
+  Writing a console log line by line into a plain string (as Buffer used
+  to) and into the chunked buffer, then reading a screen in its middle.
+  """
+  class StrBuffer:
+    def __init__(self) -> None:
+      self.buffer = ''
+
+    def write(self, text: str) -> None:
+      self.buffer += text
+
+  log = [f'{i:08d} INFO request handled in {i % 97} ms\n' for i in range(lines)]
+  for name, buffer in [('str +=', StrBuffer()), ('chunked', Buffer())]:
+    start = time.perf_counter()
+    for line in log:
+      buffer.write(line)
+    elapsed = time.perf_counter() - start
+    print(f'{name:>8}: {len(log)} writes in {elapsed * 1000:.1f}ms')
+  viewport = Viewport(buffer)
+  start = time.perf_counter()
+  viewport.scroll_to(lines // 2)
+  screen = viewport.visible_lines()
+  elapsed = time.perf_counter() - start
+  print(f'{len(buffer):,} characters, line {viewport.line} on screen after '
+        f'{elapsed * 1e6:.0f}us: {screen[0]!r}')
+
+
 if __name__ == '__main__':
   print('................................................')
   print('Just an example:')
@@ -82,5 +334,17 @@ if __name__ == '__main__':
   c.write('Hello')
   ch = c.get_char_at(0)
   print(ch)
+  
+  print('................................................')
+  print('Scrolling by lines:')
+  
+  c.write(' world!\nSecond line\nThird line\n')
+  viewport = c.current_viewport
+  viewport.scroll(1)
+  print(viewport.line, viewport.get_char_at(0), viewport.visible_lines())
+  
+  print('................................................')
+  print('Benchmark:')
+  benchmark_console()
   print('................................................')
   
\ No newline at end of file
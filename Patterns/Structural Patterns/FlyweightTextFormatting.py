@@ -2,6 +2,10 @@
 ################################################
 # Flyweights Decorator | Text Formatting
 ################################################
+import html, io, time
+from bisect import bisect_left, bisect_right, insort
+
+
 class FormattedText:
   def __init__(self, plain_text:str) -> None:
     self.plain_text = plain_text
@@ -18,34 +22,273 @@ class FormattedText:
 
 
 # Implementing Flyweight pattern
+# Ranges are kept sorted by start so rendering is a sweep over the range
+# boundaries: O(n + r log r) instead of checking every range for every
+# character. Ranges tell their owner when they change, and only the dirty
+# spans are re-rendered on the next str() (merged, and the text rebuilt in
+# one join). Text where upper() changes the length of a character ('ß' ->
+# 'SS') is always rendered in full, as positions would no longer line up.
 class BetterFormattedText:
   def __init__(self, plain_text:str) -> None:
     self.plain_text = plain_text
+    self.incremental = all(len(c.upper()) == 1 for c in set(plain_text))
     self.formatting = []
+    self.by_start = []
+    self.max_length = 0
+    self.rendered = None
+    self.dirty = []
     
   class TextRange:
-    def __init__(self, start: int, end: int, capitalize=False) -> None:
+    WATCHED = ('start', 'end', 'capitalize')
+
+    def __init__(self, start: int, end: int, capitalize=False, owner=None) -> None:
+      self.owner = None
       self.start = start
       self.end = end
       self.capitalize = capitalize
+      self.owner = owner
       
     def covers(self, position: int) -> bool:
       return self.start <= position <= self.end
 
+    def __setattr__(self, name, value) -> None:
+      owner = self.__dict__.get('owner')
+      if owner is None or name not in self.WATCHED:
+        super().__setattr__(name, value)
+        return
+      owner._unindex(self)
+      super().__setattr__(name, value)
+      owner._index(self)
+
   def get_range(self, start: int, end: int) -> str: 
-    range = self.TextRange(start, end)
+    range = self.TextRange(start, end, owner=self)
     self.formatting.append(range)
+    self._index(range)
     return range
-  
-  def __str__(self) -> str:
+
+  def remove_range(self, range: 'BetterFormattedText.TextRange') -> None:
+    self._unindex(range)
+    self.formatting.remove(range)
+    range.owner = None
+
+  def _index(self, r: 'BetterFormattedText.TextRange') -> None:
+    insort(self.by_start, r, key=lambda r: r.start)
+    self.max_length = max(self.max_length, r.end - r.start)
+    self._mark_dirty(r.start, r.end)
+
+  def _unindex(self, r: 'BetterFormattedText.TextRange') -> None:
+    k = bisect_left(self.by_start, r.start, key=lambda r: r.start)
+    while self.by_start[k] is not r:
+      k += 1
+    del self.by_start[k]
+    self._mark_dirty(r.start, r.end)
+
+  def _mark_dirty(self, start: int, end: int) -> None:
+    if self.rendered is not None and self.incremental:
+      self.dirty.append((max(start, 0), min(end, len(self.plain_text) - 1)))
+
+  def _overlapping(self, start: int, end: int) -> list:
+    """
+    Ranges touching [start, end]. No range is longer than max_length, so
+    only starts in [start - max_length, end] need to be looked at.
+    """
+    lo = bisect_left(self.by_start, start - self.max_length, key=lambda r: r.start)
+    hi = bisect_right(self.by_start, end, key=lambda r: r.start)
+    return [r for r in self.by_start[lo:hi] if r.end >= start]
+
+  def render(self, start: int, end: int) -> str:
+    """
+    Formatted text for positions start..end (inclusive).
+    """
     result = []
-    for i in range(len(self.plain_text)):
-      c = self.plain_text[i]
-      for r in self.formatting:
-        if r.covers(i) and r.capitalize:
-          c = c.upper()
-      result.append(c)
+    position = start
+    for r in self._overlapping(start, end):
+      if not r.capitalize:
+        continue
+      # by_start is sorted, so the capitalized spans come in order.
+      lo = max(r.start, position)
+      hi = min(r.end, end)
+      if lo > hi:
+        continue
+      result.append(self.plain_text[position:lo])
+      result.append(self.plain_text[lo:hi + 1].upper())
+      position = hi + 1
+    result.append(self.plain_text[position:end + 1])
     return ''.join(result)
+  
+  def _dirty_spans(self) -> list:
+    """
+    Dirty spans sorted, with overlapping and adjacent ones merged.
+    """
+    spans = []
+    for start, end in sorted(self.dirty):
+      if start > end:
+        continue
+      if spans and start <= spans[-1][1] + 1:
+        spans[-1][1] = max(spans[-1][1], end)
+      else:
+        spans.append([start, end])
+    return spans
+
+  def __str__(self) -> str:
+    if self.rendered is None or not self.incremental:
+      self.dirty = []
+      self.rendered = self.render(0, len(self.plain_text) - 1)
+      return self.rendered
+    if not self.dirty:
+      return self.rendered
+    spans = self._dirty_spans()
+    self.dirty = []
+    if sum(end - start + 1 for start, end in spans) * 4 > len(self.plain_text):
+      # Most of the text changed: a full render is cheaper.
+      self.rendered = self.render(0, len(self.plain_text) - 1)
+      return self.rendered
+    parts, position = [], 0
+    for start, end in spans:
+      parts.append(self.rendered[position:start])
+      parts.append(self.render(start, end))
+      position = end + 1
+    parts.append(self.rendered[position:])
+    self.rendered = ''.join(parts)
+    return self.rendered
+
+
+# Run-length formatting with arbitrary attributes.
+# The text is split into runs: a run starts at some position and lasts until
+# the next one, and every character in it shares the same Style. Styles are
+# flyweights (one immutable instance per attribute combination) and adjacent
+# runs with the same style are merged, so memory follows the number of
+# formatting changes, not the text length.
+class Style:
+  cache = {}
+
+  def __new__(cls, **attributes) -> 'Style':
+    key = frozenset((k, v) for k, v in attributes.items() if v is not None)
+    style = cls.cache.get(key)
+    if style is None:
+      style = super().__new__(cls)
+      style.attributes = dict(key)
+      cls.cache[key] = style
+    return style
+
+  def get(self, name:str, default=None):
+    return self.attributes.get(name, default)
+
+  def updated(self, **attributes) -> 'Style':
+    """
+    Same style with some attributes changed (None removes one).
+    """
+    return Style(**{**self.attributes, **attributes})
+
+  def __repr__(self) -> str:
+    return f'Style({self.attributes})'
+
+
+class PlainRenderer:
+  """
+  Renders to plain text: only the capitalize attribute is visible.
+  """
+  def open(self, style:Style) -> str:
+    return ''
+
+  def close(self, style:Style) -> str:
+    return ''
+
+  def text(self, style:Style, text:str) -> str:
+    return text.upper() if style.get('capitalize') else text
+
+
+class HtmlRenderer(PlainRenderer):
+  TAGS = {'bold': 'b', 'italic': 'i', 'underline': 'u'}
+
+  def open(self, style:Style) -> str:
+    tags = [f'<{tag}>' for name, tag in self.TAGS.items() if style.get(name)]
+    if style.get('color'):
+      tags.append(f'<span style="color:{html.escape(style.get("color"))}">')
+    return ''.join(tags)
+
+  def close(self, style:Style) -> str:
+    tags = [f'</{tag}>' for name, tag in self.TAGS.items() if style.get(name)]
+    if style.get('color'):
+      tags.append('</span>')
+    return ''.join(reversed(tags))
+
+  def text(self, style:Style, text:str) -> str:
+    return html.escape(super().text(style, text))
+
+
+class RunFormattedText:
+  def __init__(self, plain_text:str) -> None:
+    self.plain_text = plain_text
+    self.starts = [0]
+    self.styles = [Style()]
+
+  def _split(self, position:int) -> int:
+    """
+    Make sure a run starts at position; returns that run's index.
+    """
+    k = bisect_right(self.starts, position) - 1
+    if self.starts[k] == position:
+      return k
+    self.starts.insert(k + 1, position)
+    self.styles.insert(k + 1, self.styles[k])
+    return k + 1
+
+  def format(self, start:int, end:int, **attributes) -> None:
+    """
+    Apply attributes to positions start..end-1 (None removes one).
+    """
+    start = max(start, 0)
+    end = min(end, len(self.plain_text))
+    if start >= end:
+      return
+    first = self._split(start)
+    last = self._split(end) if end < len(self.plain_text) else len(self.starts)
+    for k in range(first, last):
+      self.styles[k] = self.styles[k].updated(**attributes)
+    self._merge(max(first - 1, 0), min(last + 1, len(self.starts)))
+
+  def _merge(self, first:int, last:int) -> None:
+    k = last - 1
+    while k > first:
+      if self.styles[k] is self.styles[k - 1]:
+        del self.starts[k]
+        del self.styles[k]
+      k -= 1
+
+  def runs(self):
+    """
+    Yield (start, end, style) for every run.
+    """
+    ends = self.starts[1:] + [len(self.plain_text)]
+    yield from zip(self.starts, ends, self.styles)
+
+  def chunks(self, renderer:PlainRenderer=None, chunk_size:int=64 * 1024):
+    """
+    Lazily render the text as chunks of at most chunk_size characters of
+    source text, so large documents never exist as one string.
+    """
+    renderer = PlainRenderer() if renderer is None else renderer
+    for start, end, style in self.runs():
+      opening = renderer.open(style)
+      if opening:
+        yield opening
+      for i in range(start, end, chunk_size):
+        yield renderer.text(style, self.plain_text[i:min(i + chunk_size, end)])
+      closing = renderer.close(style)
+      if closing:
+        yield closing
+
+  def write_to(self, stream, renderer:PlainRenderer=None) -> None:
+    """
+    Stream the rendered text into any object with write(), e.g. a file or
+    socket.makefile('w').
+    """
+    for chunk in self.chunks(renderer):
+      stream.write(chunk)
+
+  def __str__(self) -> str:
+    return ''.join(self.chunks())
 
 
 if __name__ == '__main__':
@@ -66,4 +309,40 @@ if __name__ == '__main__':
   print(bft)
   print('................................................')
   
-  
\ No newline at end of file
+  print('Changing a range re-renders only its span:')
+  r = bft.get_range(0, 3)
+  r.capitalize = True
+  print(bft)
+  r.end = 6
+  print(bft)
+  bft.remove_range(r)
+  print(bft)
+  
+  print('................................................')
+  print('Large document (1MB, 10,000 ranges):')
+  
+  text = 'lorem ipsum dolor sit amet ' * 40_000
+  bft = BetterFormattedText(text)
+  for start in range(0, len(text), len(text) // 10_000):
+    bft.get_range(start, start + 20).capitalize = True
+  start = time.perf_counter()
+  str(bft)
+  print(f'Full render: {(time.perf_counter() - start) * 1000:.1f}ms')
+  bft.formatting[0].capitalize = False
+  start = time.perf_counter()
+  str(bft)
+  print(f'Re-render after one change: {(time.perf_counter() - start) * 1000:.1f}ms')
+  print('................................................')
+  
+  print('Run-length formatting with several attributes:')
+  
+  rft = RunFormattedText('This is a brave new world')
+  rft.format(10, 15, capitalize=True)
+  rft.format(10, 19, bold=True)
+  rft.format(16, 25, color='red')
+  rft.format(16, 19, bold=None)
+  print(rft)
+  rft.write_to(buffer := io.StringIO(), HtmlRenderer())
+  print(buffer.getvalue())
+  print(list(rft.runs()))
+  print('................................................')
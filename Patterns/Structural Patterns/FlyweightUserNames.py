@@ -3,6 +3,12 @@
 # Flyweights Decorator | Usernames example
 ################################################
 import string, random
+import time, tracemalloc
+import mmap, os, struct, tempfile, threading
+from array import array
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import compress
 
 
 class User:
@@ -23,19 +29,143 @@ def random_string():
   )
 
 
+# Interning table shared by the flyweights.
+# A dict maps each string to its id and a list maps the id back to the
+# string, so both directions are O(1).
+# Thread safety: lookups of known strings take no lock. A miss takes the
+# single writer lock, checks again and appends the string before publishing
+# its id, so a reader that sees an id can always resolve it.
+class StringTable:
+  def __init__(self) -> None:
+    self.ids = {}
+    self.strings = []
+    self.lock = threading.Lock()
+
+  def _add(self, s:str) -> int:
+    with self.lock:
+      i = self.ids.get(s)
+      if i is None:
+        i = len(self.strings)
+        self.strings.append(s)
+        self.ids[s] = i
+      return i
+
+  def intern(self, s:str) -> int:
+    i = self.ids.get(s)
+    return self._add(s) if i is None else i
+
+  def intern_many(self, strings) -> list[int]:
+    get = self.ids.get
+    result = []
+    for s in strings:
+      i = get(s)
+      result.append(self._add(s) if i is None else i)
+    return result
+
+  def id_of(self, s:str) -> int:
+    """
+    Id of an already interned string, None if unknown.
+    """
+    return self.ids.get(s)
+
+  def export(self, path:str) -> None:
+    """
+    Write a read-only snapshot that StringSnapshot can memory-map.
+    Layout: magic, count, offsets (count + 1 x uint64), ids sorted by
+    string (count x uint32, for lookups by value), utf-8 blob.
+    """
+    with self.lock:
+      strings = list(self.strings)
+    encoded = [s.encode('utf-8') for s in strings]
+    offsets = array('Q', [0])
+    for b in encoded:
+      offsets.append(offsets[-1] + len(b))
+    order = array('I', sorted(range(len(encoded)), key=encoded.__getitem__))
+    with open(path, 'wb') as f:
+      f.write(struct.pack('<8sQ', StringSnapshot.MAGIC, len(encoded)))
+      f.write(offsets.tobytes())
+      f.write(order.tobytes())
+      # Keep the blob 8-byte aligned (order has count x 4 bytes).
+      f.write(b'\0' * (len(order) % 2 * 4))
+      f.write(b''.join(encoded))
+
+  def __getitem__(self, i:int) -> str:
+    return self.strings[i]
+
+  def __contains__(self, s:str) -> bool:
+    return s in self.ids
+
+  def __len__(self) -> int:
+    return len(self.strings)
+
+
+class StringSnapshot:
+  """
+  Read-only string table attached to a file written by StringTable.export.
+  The file is memory-mapped, so any number of processes share the same
+  pages and nothing is copied until a string is actually read.
+  """
+  MAGIC = b'STRTAB01'
+
+  def __init__(self, path:str) -> None:
+    with open(path, 'rb') as f:
+      self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, count = struct.unpack_from('<8sQ', self.mm)
+    if magic != self.MAGIC:
+      raise ValueError(f'{path} is not a string table snapshot')
+    self.count = count
+    self.view = view = memoryview(self.mm)
+    start = 16
+    self.offsets = view[start:start + (count + 1) * 8].cast('Q')
+    start += (count + 1) * 8
+    self.order = view[start:start + count * 4].cast('I')
+    start += count * 4 + count % 2 * 4
+    self.blob = view[start:]
+
+  def _bytes(self, i:int) -> memoryview:
+    return self.blob[self.offsets[i]:self.offsets[i + 1]]
+
+  def __getitem__(self, i:int) -> str:
+    if not 0 <= i < self.count:
+      raise IndexError('string id out of range')
+    return str(self._bytes(i), 'utf-8')
+
+  def __len__(self) -> int:
+    return self.count
+
+  def __contains__(self, s:str) -> bool:
+    return self.id_of(s) is not None
+
+  def id_of(self, s:str) -> int:
+    """
+    Binary search over the ids sorted by string.
+    """
+    b = s.encode('utf-8')
+    k = bisect_left(self.order, b, key=lambda i: self._bytes(i).tobytes())
+    if k < self.count and self._bytes(self.order[k]) == b:
+      return self.order[k]
+    return None
+
+  def close(self) -> None:
+    self.offsets.release()
+    self.order.release()
+    self.blob.release()
+    self.view.release()
+    self.mm.close()
+
+  def __enter__(self) -> 'StringSnapshot':
+    return self
+
+  def __exit__(self, *args) -> None:
+    self.close()
+
+
 # Optimizing the class
 class UserOptimized:
-  strings = []
+  strings = StringTable()
   
   def __init__(self, full_name:str) -> None:
-    def get_or_add(s):
-      if s in self.strings:
-        return self.strings.index(s)
-      else:
-        self.strings.append(s)
-        return len(self.strings) - 1
-      
-    self.names = [get_or_add(n) for n in full_name.split(' ')]
+    self.names = self.strings.intern_many(full_name.split(' '))
     
   def __str__(self) -> str:
     return ' '.join([self.strings[n] for n in self.names])
@@ -44,6 +174,126 @@ class UserOptimized:
     return f'User({self.__str__()})'
   
 
+# Columnar store: one row per user, first and last name ids kept in two
+# array('I') columns (8 bytes per user). Rows are handed out as small views.
+class UserRow:
+  __slots__ = ('table', 'i')
+
+  def __init__(self, table:'UserTable', i:int) -> None:
+    self.table = table
+    self.i = i
+
+  @property
+  def first_name(self) -> str:
+    return self.table.strings[self.table.first[self.i]]
+
+  @property
+  def last_name(self) -> str:
+    return self.table.strings[self.table.last[self.i]]
+
+  def __str__(self) -> str:
+    return f'{self.first_name} {self.last_name}'
+
+  def __repr__(self) -> str:
+    return f'User({self.__str__()})'
+
+
+class UserTable:
+  def __init__(self, strings:StringTable=None) -> None:
+    self.strings = UserOptimized.strings if strings is None else strings
+    self.first = array('I')
+    self.last = array('I')
+
+  def add(self, full_name:str) -> int:
+    first, _, last = full_name.partition(' ')
+    self.first.append(self.strings.intern(first))
+    self.last.append(self.strings.intern(last))
+    return len(self.first) - 1
+
+  def extend(self, full_names) -> None:
+    for full_name in full_names:
+      self.add(full_name)
+
+  def __len__(self) -> int:
+    return len(self.first)
+
+  def __getitem__(self, i:int) -> UserRow:
+    if i < 0:
+      i += len(self)
+    if not 0 <= i < len(self):
+      raise IndexError('user index out of range')
+    return UserRow(self, i)
+
+  def __iter__(self):
+    for i in range(len(self)):
+      yield UserRow(self, i)
+
+  def _matching(self, column:array, name:str) -> list[int]:
+    i = self.strings.id_of(name)
+    if i is None:
+      return []
+    return list(compress(range(len(column)), map(i.__eq__, column)))
+
+  def with_first_name(self, name:str) -> list[int]:
+    """
+    Row indexes of every user with this first name.
+    """
+    return self._matching(self.first, name)
+
+  def with_last_name(self, name:str) -> list[int]:
+    """
+    Row indexes of every user with this last name.
+    """
+    return self._matching(self.last, name)
+
+  def nbytes(self) -> int:
+    return (len(self.first) * self.first.itemsize +
+            len(self.last) * self.last.itemsize)
+
+
+# Worker process side of the snapshot demo.
+snapshot = None
+
+def attach_snapshot(path:str) -> None:
+  global snapshot
+  snapshot = StringSnapshot(path)
+
+
+def resolve_names(ids:list[int]) -> list[str]:
+  return [snapshot[i] for i in ids]
+
+
+def benchmark_users(size:int=100) -> None:
+  """
+  Build size*size users with each class, measuring time and the memory
+  still allocated once they exist.
+  """
+  first_names = [random_string() for _ in range(size)]
+  last_names = [random_string() for _ in range(size)]
+
+  def build_table() -> UserTable:
+    table = UserTable()
+    table.extend(f'{fn} {ln}' for fn in first_names for ln in last_names)
+    return table
+
+  builders = {
+    'User': lambda: [User(f'{fn} {ln}') for fn in first_names for ln in last_names],
+    'UserOptimized': lambda: [UserOptimized(f'{fn} {ln}') for fn in first_names for ln in last_names],
+    'UserTable': build_table,
+  }
+  for name, build in builders.items():
+    tracemalloc.start()
+    start = time.perf_counter()
+    users = build()
+    elapsed = time.perf_counter() - start
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f'{name:>13}: {len(users)} users in {elapsed * 1000:.1f}ms '
+          f'({len(users) / elapsed:,.0f} users/s), {memory / 1024:,.0f} KiB '
+          f'({memory / len(users):.0f} bytes/user)')
+    del users
+
+
 if __name__ == '__main__':
   print('................................................')
   print('User names example:')
@@ -64,3 +314,40 @@ if __name__ == '__main__':
   print(users[:10])
   
   print('................................................')
+  print('User names in a columnar table:')
+  
+  table = UserTable()
+  table.extend(f'{fn} {ln}' for fn in first_names for ln in last_names)
+  print(list(table)[:10])
+  rows = table.with_last_name(last_names[0])
+  print(f'{len(rows)} users named {last_names[0]}: {[table[i] for i in rows[:3]]}...')
+  print(f'{table.nbytes() / len(table):.0f} bytes/user in the columns')
+  
+  print('................................................')
+  print('Benchmark (User vs UserOptimized vs UserTable):')
+  benchmark_users()
+  
+  print('................................................')
+  print('Thread-safe flyweight pool:')
+  
+  pool = StringTable()
+  names = [random_string() for _ in range(1000)]
+  with ThreadPoolExecutor(max_workers=8) as executor:
+    results = list(executor.map(pool.intern_many, [names] * 32))
+  print(f'{len(pool)} strings interned, every thread got the same ids: '
+        f'{all(r == results[0] for r in results)}')
+  
+  print('................................................')
+  print('Read-only snapshot shared with worker processes:')
+  
+  with tempfile.TemporaryDirectory() as directory:
+    path = os.path.join(directory, 'strings.bin')
+    pool.export(path)
+    with ProcessPoolExecutor(max_workers=2, initializer=attach_snapshot,
+                             initargs=(path,)) as executor:
+      resolved = list(executor.map(resolve_names, [[0, 1, 2], [997, 998, 999]]))
+    print(resolved)
+    with StringSnapshot(path) as shared:
+      print(f'id_of({names[42]!r}) = {shared.id_of(names[42])}')
+  
+  print('................................................')
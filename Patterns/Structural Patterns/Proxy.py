@@ -35,10 +35,196 @@
 # Different proxies (communication, logging, caching, etc.) have completely
 # different behaviors.
 ################################################
+import ast, inspect, io, os, tempfile, textwrap, time
+
+
+# Replicating the interface can be done by a machine: generate_proxy looks
+# at the class once and writes the forwarding class out as source code, a
+# real method per method and a property per attribute, so a call through
+# the proxy costs one extra plain function call (no __getattr__ lookup).
+DUNDERS = ('__iter__', '__next__', '__len__', '__contains__', '__getitem__',
+           '__setitem__', '__enter__', '__exit__')
+
+
+def instance_attributes(cls: type) -> list:
+  """
+  Names assigned on self (self.name = ...) in the methods of cls and its
+  bases, found in their source; classes without source give none.
+  """
+  names = []
+  for klass in reversed(cls.__mro__):
+    try:
+      tree = ast.parse(textwrap.dedent(inspect.getsource(klass)))
+    except (OSError, TypeError, SyntaxError):
+      continue
+    for method in tree.body[0].body:
+      if not isinstance(method, (ast.FunctionDef, ast.AsyncFunctionDef)) \
+          or not method.args.args:
+        continue
+      this = method.args.args[0].arg
+      for node in ast.walk(method):
+        targets = getattr(node, 'targets', None) or [getattr(node, 'target', None)]
+        for target in targets:
+          if isinstance(target, ast.Attribute) \
+              and isinstance(target.value, ast.Name) \
+              and target.value.id == this and target.attr not in names:
+            names.append(target.attr)
+  return names
+
+
+def source_parameters(func, prefix: str) -> tuple:
+  """
+  Source for the parameter list of func (after self) and for passing
+  those parameters on, plus the defaults, named prefix0, prefix1, ...
+  """
+  try:
+    parameters = list(inspect.signature(func).parameters.values())[1:]
+  except (TypeError, ValueError):
+    return '*args, **kwargs', '*args, **kwargs', {}
+  params, args, positional_only = [], [], False
+  for i, p in enumerate(parameters):
+    if p.kind is not p.POSITIONAL_ONLY and positional_only:
+      params.append('/')
+      positional_only = False
+    if p.kind is p.KEYWORD_ONLY and not any(x.startswith('*') for x in params):
+      params.append('*')
+    default = '' if p.default is p.empty else f'={prefix}{i}'
+    if p.kind is p.VAR_POSITIONAL:
+      params.append(f'*{p.name}')
+      args.append(f'*{p.name}')
+    elif p.kind is p.VAR_KEYWORD:
+      params.append(f'**{p.name}')
+      args.append(f'**{p.name}')
+    elif p.kind is p.KEYWORD_ONLY:
+      params.append(p.name + default)
+      args.append(f'{p.name}={p.name}')
+    else:
+      positional_only = p.kind is p.POSITIONAL_ONLY
+      params.append(p.name + default)
+      args.append(p.name)
+  if positional_only:
+    params.append('/')
+  defaults = {f'{prefix}{i}': p.default for i, p in enumerate(parameters)
+              if p.default is not p.empty}
+  return ', '.join(params), ', '.join(args), defaults
+
+
+def generate_proxy(cls: type, attributes: tuple=None, renames: dict=None,
+                   name: str=None, source: bool=False):
+  """
+  Build a __slots__ class wrapping an instance of cls (proxy._target).
+  Public methods (and the usual dunders) of cls are forwarded by
+  generated methods with the same signatures, calling cls's functions
+  directly. attributes (default: the properties and descriptors of cls
+  plus what its methods assign on self) become forwarding properties.
+  renames maps a proxy attribute to the target attribute it reads and
+  writes, which turns the proxy into an adapter. With source=True the
+  generated source is returned as well.
+  """
+  renames = dict(renames or {})
+  if attributes is None:
+    attributes = [attr for attr in dir(cls) if not attr.startswith('_')
+                  and not callable(inspect.getattr_static(cls, attr))]
+    attributes += [attr for attr in instance_attributes(cls)
+                   if attr not in attributes and not attr.startswith('_')]
+  name = name or f'{cls.__name__}Proxy'
+  namespace = {}
+  lines = [f'class {name}:',
+           "  __slots__ = ('_target',)",
+           '  def __init__(self, target):',
+           '    self._target = target']
+  for attr in list(attributes) + [a for a in renames if a not in attributes]:
+    target = renames.get(attr, attr)
+    lines += ['  @property',
+              f'  def {attr}(self):',
+              f'    return self._target.{target}',
+              f'  @{attr}.setter',
+              f'  def {attr}(self, value):',
+              f'    self._target.{target} = value']
+  for attr in dir(cls):
+    if attr in renames or attr in attributes or \
+        attr.startswith('_') and attr not in DUNDERS:
+      continue
+    func = inspect.getattr_static(cls, attr)
+    if isinstance(func, (classmethod, staticmethod)) or not callable(func):
+      continue
+    func = getattr(cls, attr)
+    params, args, defaults = source_parameters(func, f'_{attr}_default')
+    namespace[f'_{attr}'] = func
+    namespace.update(defaults)
+    lines.append(f'  def {attr}(self{", " if params else ""}{params}):')
+    if attr == '__enter__':
+      lines += [f'    _{attr}(self._target)', '    return self']
+    else:
+      lines.append(f'    return _{attr}(self._target{", " if args else ""}{args})')
+  code = '\n'.join(lines) + '\n'
+  exec(code, namespace)
+  proxy = namespace[name]
+  return (proxy, code) if source else proxy
+
+
+class Person:
+  def __init__(self, name: str, age: int) -> None:
+    self.name = name
+    self.age = age
+
+  def greet(self, other: str='you', *, loud: bool=False) -> str:
+    greeting = f'Hi {other}, I am {self.name}'
+    return greeting.upper() if loud else greeting
+
+
+class GetattrProxy:
+  def __init__(self, target) -> None:
+    self.__dict__['_target'] = target
+
+  def __getattr__(self, item):
+    return getattr(self.__dict__['_target'], item)
+
+  def __setattr__(self, key, value):
+    setattr(self.__dict__['_target'], key, value)
+
+
+def benchmark_access(n: int=200_000) -> None:
+  """
+  Latency of an attribute read, a method call and a file write directly,
+  through a __getattr__ proxy and through a generated proxy.
+  """
+  PersonProxy = generate_proxy(Person)
+  FileProxy = generate_proxy(io.TextIOWrapper)
+  with tempfile.TemporaryDirectory() as directory, \
+       open(os.path.join(directory, 'benchmark.txt'), 'w') as f:
+    for name, wrap in [('direct', lambda x: x), ('__getattr__', GetattrProxy),
+                       ('generated', None)]:
+      person = Person('John', 45)
+      if wrap is None:
+        person, file = PersonProxy(person), FileProxy(f)
+      else:
+        person, file = wrap(person), wrap(f)
+      timings = []
+      for action in (lambda: person.age, lambda: person.greet('Jane'),
+                     lambda: file.write('x')):
+        start = time.perf_counter()
+        for _ in range(n):
+          action()
+        timings.append((time.perf_counter() - start) / n * 1e9)
+      print(f'{name:>11}: read {timings[0]:.0f}ns, call {timings[1]:.0f}ns, '
+            f'write {timings[2]:.0f}ns')
 
 
 if __name__ == '__main__':
   print('................................................')
   print('Just theory.')
   print('................................................')
+  print('Generated proxies:')
+  
+  PersonProxy, code = generate_proxy(Person, source=True)
+  print(code)
+  proxy = PersonProxy(Person('John', 45))
+  proxy.age += 1
+  print(proxy.greet(loud=True), proxy.age)
+  
+  print('................................................')
+  print('Benchmark:')
+  benchmark_access()
+  print('................................................')
   
\ No newline at end of file
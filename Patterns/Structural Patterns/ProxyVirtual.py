@@ -9,32 +9,260 @@
 ################################################
 
 
-class Bitmap:
+import mmap, os, struct, tempfile, threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+# Raw bitmap files: a small header (magic, width, height, bytes per pixel)
+# followed by the pixel rows. Any other file is treated as one row of bytes.
+HEADER = struct.Struct('<4sIII')
+MAGIC = b'RAWB'
+
+
+def write_raw_bitmap(filename: str, width: int, height: int, bpp: int=1,
+                     row=None) -> None:
+  """
+  Write a raw bitmap; row(y) gives the bytes of row y (blank by default).
+  """
+  with open(filename, 'wb') as f:
+    f.write(HEADER.pack(MAGIC, width, height, bpp))
+    for y in range(height):
+      f.write(bytes(width * bpp) if row is None else row(y))
+
+
+class RasterAccess:
+  """
+  Shared by the bitmaps: pixel access through memoryview slices of
+  self.buffer, so rows and regions are never copied.
+  """
+  closed = False
+
+  def _parse(self, buffer) -> None:
+    if len(buffer) >= HEADER.size and bytes(buffer[:4]) == MAGIC:
+      _, self.width, self.height, self.bpp = HEADER.unpack_from(buffer)
+      self.pixels = buffer[HEADER.size:]
+    else:
+      self.width, self.height, self.bpp = len(buffer), int(len(buffer) > 0), 1
+      self.pixels = buffer
+
+  @property
+  def nbytes(self) -> int:
+    return len(self.pixels)
+
+  def row(self, y: int) -> memoryview:
+    stride = self.width * self.bpp
+    return self.pixels[y * stride:(y + 1) * stride]
+
+  def region(self, x: int, y: int, width: int, height: int) -> list:
+    """
+    One memoryview per row of the region, clipped to the image.
+    """
+    x0, x1 = max(x, 0), min(x + width, self.width)
+    y0, y1 = max(y, 0), min(y + height, self.height)
+    stride = self.width * self.bpp
+    return [self.pixels[r * stride + x0 * self.bpp:r * stride + x1 * self.bpp]
+            for r in range(y0, y1)]
+
+  def tile(self, tx: int, ty: int, size: int=256) -> list:
+    return self.region(tx * size, ty * size, size, size)
+
+  def draw(self, region: tuple=None):
+    if region is None:
+      print(f'Drawing image {self.filename}')
+      return
+    rows = self.region(*region)
+    # Touching the rows is what faults their pages in.
+    ink = sum(sum(row) for row in rows)
+    print(f'Drawing {region} of image {self.filename} '
+          f'({sum(len(row) for row in rows):,} bytes read, ink {ink})')
+
+
+class Bitmap(RasterAccess):
   def __init__(self, filename: str) -> None:
     self.filename = filename
     print(f'Loading image from {self.filename}...')
+    self.data = b''
+    if os.path.exists(filename):
+      with open(filename, 'rb') as f:
+        self.data = f.read()
+    self._parse(memoryview(self.data))
+
+
+# Memory-mapped variant for large (tiled) images: nothing is read up
+# front, the OS faults in only the pages of the rows and regions actually
+# used, so resident memory follows what is drawn, not the file size.
+class MappedBitmap(RasterAccess):
+  def __init__(self, filename: str) -> None:
+    self.filename = filename
+    print(f'Mapping image from {self.filename}...')
+    self.mm = None
+    self.buffer = memoryview(b'')
+    if os.path.exists(filename) and os.path.getsize(filename):
+      with open(filename, 'rb') as f:
+        self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+      self.buffer = memoryview(self.mm)
+    self._parse(self.buffer)
+
+  def close(self) -> bool:
+    """
+    Unmap the file. While rows or regions handed out are still alive the
+    bitmap stays usable and mapped (the mapping goes with the last of
+    them); False then.
+    """
+    if self.mm is None:
+      return True
+    self.pixels.release()
+    self.buffer.release()
+    try:
+      self.mm.close()
+    except BufferError:
+      self.buffer = memoryview(self.mm)
+      self._parse(self.buffer)
+      return False
+    self.mm = None
+    self.closed = True
+    return True
 
-  def draw(self):
-    print(f'Drawing image {self.filename}')
     
     
 def draw_image(image: Bitmap):
   print('About to draw image...')
   image.draw()
   print('Done drawing image!')
+
+
+# Shared cache behind the proxies: loaded bitmaps are kept per (path,
+# mtime), so every proxy for the same file reuses one load and an edited
+# file is loaded again. The cache is bounded in bytes (least recently used
+# bitmaps go first). Concurrent requests for a bitmap being loaded wait for
+# that load instead of starting their own (single flight). prefetch()
+# loads files on a small thread pool before anyone draws them. Mapped
+# bitmaps take address space and a handle rather than memory, so their
+# cache is bounded by entries (max_bytes=None); evicted bitmaps are closed.
+class BitmapCache:
+  def __init__(self, max_bytes: int=256 * 1024 * 1024, loader=Bitmap,
+               workers: int=2, max_entries: int=None) -> None:
+    self.max_bytes = max_bytes
+    self.max_entries = max_entries
+    self.loader = loader
+    self.workers = workers
+    self.entries = OrderedDict()
+    self.bytes = 0
+    self.loading = {}
+    self.lock = threading.Lock()
+    self.executor = None
+    self.hits = 0
+    self.misses = 0
+    self.loads = 0
+
+  @staticmethod
+  def key(filename: str) -> tuple:
+    path = os.path.abspath(filename)
+    try:
+      mtime = os.stat(path).st_mtime_ns
+    except OSError:
+      mtime = None
+    return path, mtime
+
+  def get(self, filename: str) -> Bitmap:
+    key = self.key(filename)
+    with self.lock:
+      if key in self.entries:
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return self.entries[key]
+      self.misses += 1
+      future = self.loading.get(key)
+      owner = future is None
+      if owner:
+        future = self.loading[key] = Future()
+    if owner:
+      self._load(key, filename, future)
+    return future.result()
+
+  def _load(self, key: tuple, filename: str, future: Future) -> None:
+    try:
+      bitmap = self.loader(filename)
+    except BaseException as e:
+      with self.lock:
+        del self.loading[key]
+      future.set_exception(e)
+      return
+    with self.lock:
+      del self.loading[key]
+      self.loads += 1
+      self.entries[key] = bitmap
+      self.bytes += bitmap.nbytes
+      evicted = []
+      while self._over_budget():
+        evicted.append(self.entries.popitem(last=False)[1])
+        self.bytes -= evicted[-1].nbytes
+    for old in evicted:
+      self._close(old)
+    future.set_result(bitmap)
+
+  def _over_budget(self) -> bool:
+    if len(self.entries) <= 1:
+      return False
+    if self.max_entries is not None and len(self.entries) > self.max_entries:
+      return True
+    return self.max_bytes is not None and self.bytes > self.max_bytes
+
+  @staticmethod
+  def _close(bitmap) -> None:
+    close = getattr(bitmap, 'close', None)
+    if close is not None:
+      close()
+
+  def clear(self) -> None:
+    with self.lock:
+      entries = list(self.entries.values())
+      self.entries.clear()
+      self.bytes = 0
+    for bitmap in entries:
+      self._close(bitmap)
+
+  def prefetch(self, filename: str) -> Future:
+    with self.lock:
+      if self.executor is None:
+        self.executor = ThreadPoolExecutor(self.workers, 'bitmap-prefetch')
+    return self.executor.submit(self.get, filename)
+
+  def stats(self) -> dict:
+    with self.lock:
+      return {'entries': len(self.entries), 'bytes': self.bytes,
+              'hits': self.hits, 'misses': self.misses, 'loads': self.loads}
+
+
+bitmap_cache = BitmapCache()
+mapped_bitmap_cache = BitmapCache(max_bytes=None, loader=MappedBitmap,
+                                  max_entries=64)
   
 
 # We do not want to Loading image if not drawing
 # Adding a proxy
 class LazyBitmap:
-  def __init__(self, filename: str) -> None:
+  def __init__(self, filename: str, cache: BitmapCache=None) -> None:
     self.filename = filename
     self._bitmap = None
+    self._cache = bitmap_cache if cache is None else cache
   
-  def draw(self):
-    if not self._bitmap:
-      self._bitmap = Bitmap(self.filename)
-    self._bitmap.draw()
+  def draw(self, region: tuple=None):
+    if not self._bitmap or self._bitmap.closed:
+      self._bitmap = self._cache.get(self.filename)
+    self._bitmap.draw(region)
+
+  def prefetch(self) -> Future:
+    """
+    Start loading in the background; draw() then finds it ready.
+    """
+    return self._cache.prefetch(self.filename)
+
+  def region(self, x: int, y: int, width: int, height: int) -> list:
+    if not self._bitmap or self._bitmap.closed:
+      self._bitmap = self._cache.get(self.filename)
+    return self._bitmap.region(x, y, width, height)
   
   
 if __name__ == '__main__':
@@ -59,4 +287,40 @@ if __name__ == '__main__':
   #draw_image(bmp)
   
   print('................................................')
-  
\ No newline at end of file
+  print('Proxies sharing one cache:')
+  
+  proxies = [LazyBitmap('facepalm.jpg') for _ in range(3)]
+  for proxy in proxies:
+    proxy.draw()
+  # Four threads asking for the same file at once: loaded a single time.
+  threads = [threading.Thread(target=bitmap_cache.get, args=('dog.jpg',))
+             for _ in range(4)]
+  for t in threads:
+    t.start()
+  for t in threads:
+    t.join()
+  LazyBitmap('dog.jpg').draw()
+  
+  print('................................................')
+  print('Prefetching:')
+  
+  bmp = LazyBitmap('elsalvadormap.jpg')
+  bmp.prefetch().result()
+  draw_image(bmp)
+  print(bitmap_cache.stats())
+  
+  print('................................................')
+  print('Memory-mapped tiled image:')
+  
+  with tempfile.TemporaryDirectory() as directory:
+    big = os.path.join(directory, 'tiles.raw')
+    write_raw_bitmap(big, 4096, 4096, row=lambda y: bytes([y % 256]) * 4096)
+    bmp = LazyBitmap(big, cache=mapped_bitmap_cache)
+    rows = bmp.region(1024, 2048, 256, 256)
+    print(f'{len(rows)} rows of {len(rows[0])} bytes viewed, '
+          f'{os.path.getsize(big):,} bytes in the file')
+    bmp.draw((1024, 2048, 256, 256))
+    del rows, bmp
+    mapped_bitmap_cache.clear()
+  
+  print('................................................')